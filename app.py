@@ -4,7 +4,23 @@ import time
 import os
 from flask import Flask, request, jsonify, render_template
 import yaml
-import requests
+from checkpoint import AttendanceCheckpoint
+from dedup_store import DedupStore
+from device_registry import DeviceRegistry, parse_devices
+from pipeline import ScanPipeline, ScanEvent, PrintJob
+from meal_windows import parse_meal_windows, current_window
+from poll_scheduler import AdaptivePollScheduler
+from user_directory import UserDirectory
+from event_journal import EventJournal
+from school_api import SchoolApiClient
+from payment_cache import PaymentCache
+from prefetch import PaymentPrefetcher
+from single_flight import SingleFlight
+from circuit_breaker import CircuitBreaker
+from fee_ledger import FeeLedger
+from meal_rules import MealRules
+from photo_cache import PhotoCache
+from printer_pool import parse_printers
 # Import our device and printer modules with error handling
 try:
     from zk_device import ZKDevice
@@ -21,17 +37,86 @@ logger = logging.getLogger("zk-middleware")
 device_ip = os.environ.get("DEVICE_IP", "192.168.1.100")
 device_port = int(os.environ.get("DEVICE_PORT", "4370"))
 device_timeout = int(os.environ.get("DEVICE_TIMEOUT", "10"))
+# Probe an idle device connection after this many seconds instead of reconnecting
+device_keepalive = int(os.environ.get("DEVICE_KEEPALIVE", "30"))
+# Full log downloads start at least this many times their last duration apart
+device_transfer_spacing = float(os.environ.get("DEVICE_TRANSFER_SPACING", "4"))
+# "poll" pulls logs every interval, "live" streams scans as they happen
+ingestion_mode = os.environ.get("INGESTION_MODE", "poll")
+# Optional list of several terminals: "lane1@192.168.1.100:4370,lane2@192.168.1.101"
+devices_spec = os.environ.get("DEVICES", "")
+device_pool_size = int(os.environ.get("DEVICE_POOL_SIZE", "4"))
+# How often the cached device user directory checks for enrolment changes
+user_refresh_interval = int(os.environ.get("USER_REFRESH_INTERVAL", "60"))
+
+# Meal windows, e.g. "breakfast=07:00-08:30,lunch=12:30-14:00,supper=17:30-19:00"
+meal_windows_spec = os.environ.get("MEAL_WINDOWS", "breakfast=07:00-08:30,lunch=12:30-14:00,supper=17:30-19:00")
+# Adaptive polling: fast inside meal windows / rushes, slow when idle
+poll_fast_interval = float(os.environ.get("POLL_FAST_INTERVAL", "0.5"))
+poll_idle_interval = float(os.environ.get("POLL_IDLE_INTERVAL", "30"))
+poll_rush_threshold = int(os.environ.get("POLL_RUSH_THRESHOLD", "5"))
+# YAML file with meal eligibility rules, reloaded when it changes
+meal_rules_file = os.environ.get("MEAL_RULES_FILE", "")
+
+# Clear committed records from the device log (outside meal windows)
+device_log_rotation = os.environ.get("DEVICE_LOG_ROTATION", "false").lower() == "true"
+rotate_min_records = int(os.environ.get("ROTATE_MIN_RECORDS", "1000"))
+
+# Scan pipeline sizing (ingestion -> decision -> print)
+scan_queue_size = int(os.environ.get("SCAN_QUEUE_SIZE", "200"))
+decision_workers = int(os.environ.get("DECISION_WORKERS", "4"))
+print_queue_size = int(os.environ.get("PRINT_QUEUE_SIZE", "50"))
 
 school_api_base_url = os.environ.get("SCHOOL_API_BASE_URL", "https://school.example.com/api")
 school_api_key = os.environ.get("SCHOOL_API_KEY", "REPLACE_WITH_SECRET")
+school_api_pool_size = int(os.environ.get("SCHOOL_API_POOL_SIZE", "10"))
+school_api_timeout = float(os.environ.get("SCHOOL_API_TIMEOUT", "6"))
+# End-to-end budget (seconds) for a scan's payment decision
+scan_deadline = float(os.environ.get("SCAN_DEADLINE", "2.5"))
+# Hedge a slow school API request after this latency percentile
+hedge_percentile = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+# Extra attempts (hedges + retries) allowed per normal request
+retry_budget_ratio = float(os.environ.get("RETRY_BUDGET_RATIO", "0.1"))
+# Payment status cache in front of the school API
+payment_cache_size = int(os.environ.get("PAYMENT_CACHE_SIZE", "5000"))
+payment_ttl_paid = int(os.environ.get("PAYMENT_TTL_PAID", "3600"))
+payment_ttl_unpaid = int(os.environ.get("PAYMENT_TTL_UNPAID", "300"))
+payment_ttl_not_found = int(os.environ.get("PAYMENT_TTL_NOT_FOUND", "600"))
+# Warm the payment cache this many seconds before each meal window (0 = off)
+prefetch_lead_time = int(os.environ.get("PREFETCH_LEAD_TIME", "600"))
+prefetch_page_size = int(os.environ.get("PREFETCH_PAGE_SIZE", "500"))
+# Circuit breaker around the school API
+breaker_failure_threshold = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+breaker_reset_timeout = int(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))
+school_api_health_path = os.environ.get("SCHOOL_API_HEALTH_PATH", "health")
+# Oldest cached status used for decisions while the school API is down
+stale_max_age = int(os.environ.get("STALE_MAX_AGE", "86400"))
+# Local replica of the fee ledger, delta-synced from the bulk fees endpoint
+fee_ledger_enabled = os.environ.get("FEE_LEDGER", "false").lower() == "true"
+fee_ledger_sync_interval = int(os.environ.get("FEE_LEDGER_SYNC_INTERVAL", "60"))
+fee_ledger_full_sync_interval = int(os.environ.get("FEE_LEDGER_FULL_SYNC_INTERVAL", "21600"))
+fee_ledger_max_lag = int(os.environ.get("FEE_LEDGER_MAX_LAG", "300"))
+# Shared secret for the payment invalidation webhook (unset = no check)
+webhook_token = os.environ.get("WEBHOOK_TOKEN", "")
 
 printer_type = os.environ.get("PRINTER_TYPE", "network")
 printer_host = os.environ.get("PRINTER_HOST", "192.168.1.200")
 printer_port = int(os.environ.get("PRINTER_PORT", "9100"))
+# Optional pool of network printers: "lane1@192.168.1.200:9100,lane2@192.168.1.201"
+printers_spec = os.environ.get("PRINTERS", "")
+# Seconds a printer that failed a job is skipped by routing
+printer_down_time = int(os.environ.get("PRINTER_DOWN_TIME", "30"))
+# Seconds between printer status probes (DLE EOT), which also reconnect
+printer_probe_interval = int(os.environ.get("PRINTER_PROBE_INTERVAL", "10"))
 
 listen_host = os.environ.get("LISTEN_HOST", "0.0.0.0")
 listen_port = int(os.environ.get("PORT", "5000"))
 
+# Directory for durable middleware state (checkpoints, dedup store, ...)
+state_dir = os.environ.get("STATE_DIR", "data")
+# Disk budget (MB) for print-ready student photos (0 disables the cache)
+photo_cache_size_mb = int(os.environ.get("PHOTO_CACHE_SIZE_MB", "20"))
+
 # Create config dictionary
 # Handle file-based printer configuration
 if printer_type == "file":
@@ -53,16 +138,73 @@ cfg = {
     "device": {
         "ip": device_ip,
         "port": device_port,
-        "timeout": device_timeout
+        "timeout": device_timeout,
+        "keepalive": device_keepalive,
+        "transfer_spacing": device_transfer_spacing,
+        "ingestion_mode": ingestion_mode
+    },
+    "devices": parse_devices(devices_spec, default_port=device_port, default_timeout=device_timeout),
+    "device_pool_size": device_pool_size,
+    "user_refresh_interval": user_refresh_interval,
+    "meal_windows": parse_meal_windows(meal_windows_spec),
+    "meal_rules_file": meal_rules_file,
+    "polling": {
+        "fast_interval": poll_fast_interval,
+        "idle_interval": poll_idle_interval,
+        "rush_threshold": poll_rush_threshold
+    },
+    "log_rotation": {
+        "enabled": device_log_rotation,
+        "min_records": rotate_min_records
     },
     "school_api": {
         "base_url": school_api_base_url,
-        "api_key": school_api_key
+        "api_key": school_api_key,
+        "pool_size": school_api_pool_size,
+        "timeout": school_api_timeout,
+        "scan_deadline": scan_deadline,
+        "hedge_percentile": hedge_percentile,
+        "retry_budget_ratio": retry_budget_ratio,
+        "webhook_token": webhook_token,
+        "health_path": school_api_health_path,
+        "breaker_failure_threshold": breaker_failure_threshold,
+        "breaker_reset_timeout": breaker_reset_timeout,
+        "stale_max_age": stale_max_age
+    },
+    "payment_cache": {
+        "max_entries": payment_cache_size,
+        "ttl_paid": payment_ttl_paid,
+        "ttl_unpaid": payment_ttl_unpaid,
+        "ttl_not_found": payment_ttl_not_found
+    },
+    "fee_ledger": {
+        "enabled": fee_ledger_enabled,
+        "sync_interval": fee_ledger_sync_interval,
+        "full_sync_interval": fee_ledger_full_sync_interval,
+        "max_lag": fee_ledger_max_lag
+    },
+    "prefetch": {
+        "lead_time": prefetch_lead_time,
+        "per_page": prefetch_page_size
     },
     "printer": printer_config,
+    "printers": parse_printers(printers_spec, default_port=printer_port),
+    "photo_cache": {
+        "max_bytes": photo_cache_size_mb * 1024 * 1024
+    },
     "app": {
         "listen_host": listen_host,
         "listen_port": listen_port
+    },
+    "state": {
+        "dir": state_dir
+    },
+    "pipeline": {
+        "queue_size": scan_queue_size,
+        "decision_workers": decision_workers,
+        "print_queue_size": print_queue_size,
+        "printer_down_time": printer_down_time,
+        "printer_probe_interval": printer_probe_interval
     }
 }
 
@@ -70,146 +212,518 @@ cfg = {
 device_cfg = cfg["device"]
 api_cfg = cfg["school_api"]
 printer_cfg = cfg.get("printer", {})
+state_cfg = cfg["state"]
+
+# Without DEVICES the single DEVICE_IP terminal is the only device
+if not cfg["devices"]:
+    cfg["devices"] = [dict(device_cfg, name="device1")]
+for d in cfg["devices"]:
+    d.setdefault("ingestion_mode", ingestion_mode)
+# Without PRINTERS the PRINTER_* printer is the only printer
+if not cfg["printers"]:
+    cfg["printers"] = [dict(printer_cfg, name="printer1")]
+
+# Durable per-device high-water mark so each poll only handles new records
+checkpoints = AttendanceCheckpoint(os.path.join(state_cfg["dir"], "checkpoints.json"))
+
+# Shared keep-alive connection pool to the school API
+school_api = SchoolApiClient(api_cfg["base_url"], api_cfg.get("api_key", ""),
+                             pool_size=api_cfg["pool_size"], timeout=api_cfg["timeout"],
+                             hedge_percentile=api_cfg["hedge_percentile"],
+                             retry_budget_ratio=api_cfg["retry_budget_ratio"])
+
+payment_cache = PaymentCache(**cfg["payment_cache"])
+ledger_cfg = cfg["fee_ledger"]
+fee_ledger = FeeLedger(os.path.join(state_cfg["dir"], "fee_ledger.json"),
+                       sync_interval=ledger_cfg["sync_interval"],
+                       full_sync_interval=ledger_cfg["full_sync_interval"],
+                       max_lag=ledger_cfg["max_lag"]) if ledger_cfg["enabled"] else None
+# Concurrent lookups of the same student share one upstream request
+payment_lookups = SingleFlight()
+# Stop waiting on school API timeouts while it is down
+school_api_breaker = CircuitBreaker(
+    "school-api",
+    lambda: school_api.health(api_cfg["health_path"]),
+    failure_threshold=api_cfg["breaker_failure_threshold"],
+    reset_timeout=api_cfg["breaker_reset_timeout"],
+)
+# Student photos kept on disk as ready-to-print rasters
+photo_cache = PhotoCache(os.path.join(state_cfg["dir"], "photos"),
+                         max_bytes=cfg["photo_cache"]["max_bytes"]) \
+    if cfg["photo_cache"]["max_bytes"] > 0 else None
+prefetcher = PaymentPrefetcher(school_api, payment_cache, cfg["meal_windows"],
+                               lead_time=cfg["prefetch"]["lead_time"],
+                               per_page=cfg["prefetch"]["per_page"],
+                               on_student=lambda record: photo_cache and photo_cache.warm(record.get("photo_url")))
+
+# Eligibility rules evaluated locally against the payment status
+meal_rules = MealRules(cfg["meal_windows"], path=cfg["meal_rules_file"] or None,
+                       state_path=os.path.join(state_cfg["dir"], "meals_served.jsonl"))
 
 # Global variables for services
 zk = None
 printer = None
+# (name, TicketPrinter) for every configured printer; printer is the first
+printers = []
+# (name, ZKDevice, device_cfg) for every configured terminal; zk is the first
+devices = []
+registry = None
+pipeline = None
+# Write-ahead journal of scan state transitions, opened by the ingestion process
+journal = None
+# uid -> name index for tuple-shaped logs that carry no name
+user_directory = UserDirectory(refresh_interval=cfg["user_refresh_interval"])
 
 def init_services():
     """Initialize services lazily to avoid issues with worker processes"""
-    global zk, printer
-    if zk is None and ZKDevice is not None:
-        try:
-            zk = ZKDevice(device_cfg["ip"], port=device_cfg.get("port", 4370), timeout=device_cfg.get("timeout", 10))
-        except Exception as e:
-            logger.error("Failed to initialize ZKDevice: %s", e)
-            zk = None
-    if printer is None and TicketPrinter is not None:
-        try:
-            printer = TicketPrinter(printer_cfg)
-        except Exception as e:
-            logger.error("Failed to initialize TicketPrinter: %s", e)
-            printer = None
+    global zk, printer, pipeline
+    if not devices and ZKDevice is not None:
+        for d in cfg["devices"]:
+            try:
+                device = ZKDevice(d["ip"], port=d.get("port", 4370), timeout=d.get("timeout", 10),
+                                  keepalive_interval=device_cfg["keepalive"],
+                                  transfer_spacing=device_cfg["transfer_spacing"])
+                devices.append((d["name"], device, d))
+            except Exception as e:
+                logger.error("Failed to initialize ZKDevice %s: %s", d["name"], e)
+        zk = devices[0][1] if devices else None
+    if not printers and TicketPrinter is not None:
+        for p in cfg["printers"]:
+            try:
+                printers.append((p["name"], TicketPrinter(p, photo_cache=photo_cache)))
+            except Exception as e:
+                logger.error("Failed to initialize TicketPrinter %s: %s", p["name"], e)
+        printer = printers[0][1] if printers else None
+    if pipeline is None:
+        pipeline_cfg = cfg["pipeline"]
+        pipeline = ScanPipeline(
+            decide_scan,
+            printers,
+            queue_size=pipeline_cfg["queue_size"],
+            decision_workers=pipeline_cfg["decision_workers"],
+            print_queue_size=pipeline_cfg["print_queue_size"],
+            prepare=prepare_scans,
+            printer_down_time=pipeline_cfg["printer_down_time"],
+            printer_probe_interval=pipeline_cfg["printer_probe_interval"],
+        )
+        pipeline.start()
 
 app = Flask(__name__, template_folder='templates')
 
-# In-memory seen logs to avoid duplicates (simple approach)
-seen_log_ids = set()
+# Processed event ids: bounded in-memory window backed by SQLite so a
+# restart does not reprocess (and reprint) records still on the device
+seen_log_ids = DedupStore(
+    os.path.join(state_cfg["dir"], "dedup.sqlite3"),
+    window_seconds=int(os.environ.get("DEDUP_WINDOW_SECONDS", "3600")),
+    max_entries=int(os.environ.get("DEDUP_MAX_ENTRIES", "10000")),
+)
 
-def check_payment(student_id):
+def check_payment(student_id, deadline=None):
     """
     Query the school system to check paid status.
     Expecting endpoint: GET /api/students/{id}/fees
     returns JSON { "paid": true, "details": "..." }
+    Results are served from the payment cache while fresh, then from the
+    local fee ledger replica while it is in sync, and concurrent lookups of
+    the same student are coalesced into one upstream request.
+    While the school API circuit is open (or a lookup fails), the last known
+    status is used if it is recent enough, flagged with "stale": true.
+    `deadline` (time.monotonic()) bounds the time spent on the school API.
+    If it passed before a request could be sent (the scan waited in the
+    queue) and there is no stale status to use, the lookup gets one fresh
+    SCAN_DEADLINE rather than denying the scan.
     """
-    headers = {"Authorization": f"Bearer {api_cfg.get('api_key', '')}"}
-    url = f"{api_cfg['base_url'].rstrip('/')}/students/{student_id}/fees"
-    try:
-        r = requests.get(url, headers=headers, timeout=6, verify=True)
-        if r.status_code == 200:
-            return r.json()
+    student_id = str(student_id)
+    cached = payment_cache.get(student_id)
+    if cached is not None:
+        return cached
+    if fee_ledger is not None:
+        replicated = fee_ledger.fresh_result(student_id)
+        if replicated is not None:
+            return replicated
+    if school_api_breaker.allow():
+        result = dict(payment_lookups.do(student_id, lambda: fetch_payment(student_id, deadline)))
+        if not result.get("error") or result["error"] == "not_found":
+            return result
+        fallback_error = result
+    else:
+        fallback_error = {"paid": False, "error": "circuit_open"}
+    stale = stale_payment(student_id)
+    if stale is not None:
+        return stale
+    if fallback_error["error"] == "deadline_exceeded":
+        # Out of time before asking, with nothing to fall back on: a late
+        # answer beats denying the student for our own queueing delay
+        retry_deadline = time.monotonic() + api_cfg["scan_deadline"]
+        result = dict(payment_lookups.do(student_id, lambda: fetch_payment(student_id, retry_deadline)))
+        if not result.get("error") or result["error"] == "not_found":
+            return result
+        fallback_error = result
+    return fallback_error
+
+def check_payments(student_ids, deadline=None):
+    """
+    Paid status for several students: fresh cache entries are used as is,
+    the rest are fetched with one batch call to the school API and cached.
+    Returns {student_id: result}.
+    """
+    results = {}
+    missing = []
+    for student_id in dict.fromkeys(str(sid) for sid in student_ids):
+        cached = payment_cache.get(student_id)
+        if cached is None and fee_ledger is not None:
+            cached = fee_ledger.fresh_result(student_id)
+        if cached is not None:
+            results[student_id] = cached
         else:
-            logger.warning("School API returned %s for %s", r.status_code, student_id)
-            return {"paid": False, "error": "api_error"}
-    except Exception as e:
-        logger.exception("School API call failed: %s", e)
-        return {"paid": False, "error": "exception"}
+            missing.append(student_id)
+    if not missing:
+        return results
+    if school_api_breaker.allow():
+        fetched = school_api.get_fees_batch(missing, deadline=deadline)
+        record_upstream_outcome(fetched.values())
+        for student_id, result in fetched.items():
+            payment_cache.put(student_id, result)
+        results.update(fetched)
+    for student_id in missing:
+        result = results.get(student_id)
+        if result is None or (result.get("error") and result["error"] != "not_found"):
+            results[student_id] = stale_payment(student_id) or result or {"paid": False, "error": "circuit_open"}
+    return results
+
+def prepare_scans(events):
+    """Look up the payment status of a batch of scans with one upstream call"""
+    deadlines = [e.deadline for e in events if e.deadline is not None]
+    check_payments([e.student_id for e in events], deadline=min(deadlines) if deadlines else None)
+
+def fetch_payment(student_id, deadline=None):
+    """
+    Fetch a student's payment status from the school API and cache it.
+    An expired cache entry is revalidated with a conditional GET; a 304
+    re-arms its TTL without downloading the record again.
+    """
+    validators = payment_cache.validators(student_id)
+    result, validators = school_api.get_fees_conditional(student_id, validators, deadline=deadline)
+    if result is None:
+        school_api_breaker.record_success()
+        result = payment_cache.refresh(student_id)
+        if result is not None:
+            return result
+        # Entry evicted while revalidating
+        result, validators = school_api.get_fees_conditional(student_id, deadline=deadline)
+    record_upstream_outcome([result])
+    payment_cache.put(student_id, result, validators=validators)
+    return result
 
-def handle_log_entry(log):
+def record_upstream_outcome(results):
     """
-    Process a single attendance/log entry.
+    Feed school API results to the circuit breaker. "deadline_exceeded"
+    results (no request sent) count as neither success nor failure.
+    """
+    results = [r for r in results if r.get("error") != "deadline_exceeded"]
+    if any(school_api.is_upstream_failure(r) for r in results):
+        school_api_breaker.record_failure()
+    elif results:
+        school_api_breaker.record_success()
+
+def stale_payment(student_id):
+    """Last known payment status within STALE_MAX_AGE, flagged for audit"""
+    result, age = payment_cache.get_stale(student_id, api_cfg["stale_max_age"])
+    if result is None and fee_ledger is not None and fee_ledger.synced_at is not None:
+        age = time.time() - fee_ledger.synced_at
+        if age <= api_cfg["stale_max_age"]:
+            result = fee_ledger.result(student_id)
+    if result is None:
+        return None
+    result["stale"] = True
+    result["stale_age"] = int(age)
+    return result
+
+def parse_log(log):
+    """
+    Return (student_id, event_id, name) for an attendance/log entry.
     log format depends on pyzk/device. Commonly:
     (uid, timestamp, status, punch)
     or object with attributes.
     We'll be defensive when parsing.
     """
+    # Example parsing - adapt to actual log structure
+    # pyzk returns object with user_id or tuple. Try both
+    if hasattr(log, 'user_id'):
+        student_id = str(log.user_id)
+        event_id = getattr(log, 'id', f"{student_id}-{log.timestamp}")
+        name = getattr(log, 'name', None)
+    else:
+        # tuple: (uid, timestamp, status)
+        student_id = str(log[0])
+        event_id = f"{student_id}-{str(log[1])}"
+        name = None
+    name = name or user_directory.lookup(student_id) or "Unknown"
+    return student_id, str(event_id), name
+
+def device_name(device):
+    """Configured name of a ZKDevice (used to find it again after a restart)"""
+    for name, d, _ in devices:
+        if d is device:
+            return name
+    return None
+
+def device_by_name(name):
+    for n, d, _ in devices:
+        if n == name:
+            return d
+    return zk
+
+def record_events(entries, wait=True):
+    """Append (event_id, state, data) transitions to the event journal, if open"""
+    if journal is not None:
+        journal.append_many(entries, wait=wait)
+
+def handle_log_batch(logs, device=None):
+    """
+    Process the new attendance/log entries from one poll.
+    `device` is the ZKDevice the logs came from (defaults to the first device).
+
+    New scans are journaled as "received" (one group-committed fsync for the
+    whole batch), marked as seen and queued on the scan pipeline; payment
+    checks and printing happen on the pipeline workers. Raises JournalError
+    if the batch could not be journaled.
+    """
     # Initialize services if not already done
     init_services()
-    
-    # Example parsing - adapt to actual log structure
-    try:
-        # pyzk returns object with user_id or tuple. Try both
-        if hasattr(log, 'user_id'):
-            student_id = str(log.user_id)
-            event_id = getattr(log, 'id', f"{student_id}-{log.timestamp}")
-            name = getattr(log, 'name', 'Unknown')
-        else:
-            # tuple: (uid, timestamp, status)
-            student_id = str(log[0])
-            event_id = f"{student_id}-{str(log[1])}"
-            name = "Unknown"
+    device = device or zk
 
+    events = []
+    for log in logs:
+        try:
+            student_id, event_id, name = parse_log(log)
+        except Exception as e:
+            logger.exception("Error processing log: %s", e)
+            continue
         if event_id in seen_log_ids:
+            continue
+        events.append(ScanEvent(student_id, event_id, name=name, device=device,
+                                deadline=time.monotonic() + api_cfg["scan_deadline"]))
+    if not events:
+        return
+
+    # Not caught: if the scans can't be journaled the ingestor must not
+    # advance the device checkpoint past them
+    record_events([(e.event_id, "received", {
+        "student_id": e.student_id,
+        "name": e.name,
+        "device": device_name(device),
+    }) for e in events])
+    try:
+        new_events = []
+        for e in events:
+            if not seen_log_ids.add_if_new(e.event_id):
+                continue
+            logger.info("Processing log for student_id=%s event=%s", e.student_id, e.event_id)
+            new_events.append(e)
+        if new_events:
+            pipeline.submit_batch(new_events)
+    except Exception as e:
+        logger.exception("Error processing logs: %s", e)
+
+def handle_log_entry(log, device=None):
+    """
+    Process a single attendance/log entry (see handle_log_batch).
+    """
+    handle_log_batch([log], device=device)
+
+def journaled_print_job(event_id, method, kwargs, student_id, device=None, decision=None):
+    """
+    PrintJob whose outcome is recorded in the event journal. If the ticket
+    for an allowed `decision` fails to print, its meal is given back.
+    """
+    def on_done(ok):
+        if not ok and decision is not None:
+            meal_rules.release(student_id, decision)
+        record_events([(event_id, "printed" if ok else "failed", None)])
+        if method != "print_ticket":
             return
-        seen_log_ids.add(event_id)
-
-        logger.info("Processing log for student_id=%s event=%s", student_id, event_id)
-
-        # Call school API
-        res = check_payment(student_id)
-        if res.get("paid"):
-            details = res.get("details", "Lunch payment confirmed")
-            # Print ticket with student photo
-            if printer is not None:
-                photo_url = res.get("photo_url")
-                ok = printer.print_ticket(student_name=name, student_id=student_id, details=details, photo_url=photo_url)
-                if ok:
-                    logger.info("Ticket printed for %s", student_id)
-                    # optionally send device display success
-                    if zk is not None:
-                        zk.send_display_message("Access granted - Ticket printed")
-                else:
-                    logger.warning("Failed to print ticket for %s", student_id)
-            else:
-                logger.warning("Printer not available, skipping ticket print for %s", student_id)
+        if ok:
+            logger.info("Ticket printed for %s", student_id)
+            # optionally send device display success
+            if device is not None:
+                device.send_display_message("Access granted - Ticket printed")
         else:
-            # send error to device and log
-            reason = res.get("error", "Unpaid")
-            if zk is not None:
-                zk.send_display_message("Fee unpaid. Contact admin.")
-            if printer is not None:
-                photo_url = res.get("photo_url")
-                printer.print_error("Fee not paid for today's meal", photo_url=photo_url)
-            logger.info("Student %s not paid: %s", student_id, reason)
-    except Exception as e:
-        logger.exception("Error processing log: %s", e)
+            logger.warning("Failed to print ticket for %s", student_id)
+
+    return PrintJob(method, kwargs, student_id=student_id, on_done=on_done,
+                    lane=device_name(device) if device is not None else None)
+
+def decide_scan(event):
+    """
+    Decision stage: check payment and return the PrintJob for this scan.
+    """
+    student_id = event.student_id
+    device = event.device
+
+    # Call school API
+    res = check_payment(student_id, deadline=event.deadline)
+    if res.get("stale"):
+        logger.warning("AUDIT: decision for %s (event %s) uses cached status %ss old, school API unavailable",
+                       student_id, event.event_id, res.get("stale_age"))
+    decision = meal_rules.decide(student_id, res)
+    if decision.grace:
+        logger.warning("AUDIT: student %s (event %s) served under a grace override", student_id, event.event_id)
+    if decision.allowed:
+        # Print ticket with student photo
+        method = "print_ticket"
+        kwargs = {
+            "student_name": event.name,
+            "student_id": student_id,
+            "details": res.get("details", "Lunch payment confirmed") if res.get("paid") else "Meal allowed",
+            "photo_url": res.get("photo_url"),
+        }
+    else:
+        # send error to device and log
+        if device is not None:
+            device.send_display_message(f"{decision.message}.")
+        logger.info("Student %s denied: %s (%s)", student_id, decision.reason, res.get("error", "Unpaid"))
+        method = "print_error"
+        kwargs = {
+            "message": decision.message,
+            "photo_url": res.get("photo_url"),
+        }
+
+    record_events([(event.event_id, "decided", {"job": {"method": method, "kwargs": kwargs},
+                                                "rule": decision.as_dict(),
+                                                "stale": bool(res.get("stale"))})],
+                  wait=False)
+    return journaled_print_job(event.event_id, method, kwargs, student_id, device=device,
+                               decision=decision if decision.allowed else None)
+
+def recover_journal():
+    """
+    Finish scans left unfinished by a crash or restart: re-decide events
+    that were only received, re-queue the print for events already decided.
+    """
+    for entry in journal.pending():
+        data = entry["data"]
+        device = device_by_name(data.get("device"))
+        student_id = data.get("student_id")
+        if student_id is None:
+            continue
+        seen_log_ids.add(entry["id"])
+        job = data.get("job")
+        if entry["state"] == "decided" and job:
+            logger.info("Recovering print for student_id=%s event=%s", student_id, entry["id"])
+            pipeline.submit_print(journaled_print_job(entry["id"], job["method"], job["kwargs"],
+                                                      student_id, device=device))
+        else:
+            logger.info("Recovering scan for student_id=%s event=%s", student_id, entry["id"])
+            pipeline.submit(ScanEvent(student_id, entry["id"], name=data.get("name", "Unknown"),
+                                      device=device,
+                                      deadline=time.monotonic() + api_cfg["scan_deadline"]))
 
 def polling_loop(poll_interval=5):
-    """Polling loop for device attendance logs"""
+    """Ingestion loop for all configured devices (polling or live capture)"""
+    global registry, journal
     # Initialize services
     init_services()
+
+    if journal is None:
+        journal = EventJournal(os.path.join(state_cfg["dir"], "events.journal"))
+        recover_journal()
     
-    # Skip polling if ZK device is not available
-    if zk is None:
+    # Skip polling if no ZK device is available
+    if not devices:
         logger.warning("ZK device not available, skipping polling loop")
         return
         
-    logger.info("Starting device polling loop")
-    while True:
-        try:
-            # Connect to device if not already connected
-            if not hasattr(zk, '_connected') or not zk._connected:
-                zk.connect()
-                zk._connected = True
-                
-            logs = zk.pull_attendance()
-            if logs:
-                for l in logs:
-                    handle_log_entry(l)
-            time.sleep(poll_interval)
-        except Exception as e:
-            logger.exception("Polling loop error: %s. Reconnecting...", e)
-            try:
-                zk.disconnect()
-                zk._connected = False
-            except:
-                pass
-            time.sleep(5)
+    for _, _, d in devices:
+        d.setdefault("poll_interval", poll_interval)
+    logger.info("Starting device ingestion for %d device(s)", len(devices))
+    user_directory.start([(name, d) for name, d, _ in devices])
+    if cfg["prefetch"]["lead_time"] > 0:
+        prefetcher.start()
+    if fee_ledger is not None:
+        fee_ledger.start(school_api, per_page=cfg["prefetch"]["per_page"])
+    polling_cfg = cfg["polling"]
+
+    def make_scheduler():
+        return AdaptivePollScheduler(
+            cfg["meal_windows"],
+            fast_interval=polling_cfg["fast_interval"],
+            normal_interval=poll_interval,
+            idle_interval=polling_cfg["idle_interval"],
+            rush_threshold=polling_cfg["rush_threshold"],
+        )
+
+    rotation_cfg = cfg["log_rotation"]
+
+    def make_rotation(name, device):
+        if not rotation_cfg["enabled"]:
+            return None
+        return {
+            "min_records": rotation_cfg["min_records"],
+            "archive_path": os.path.join(state_cfg["dir"], "archive", f"{name}.jsonl"),
+            # Never rotate while students are being served
+            "allowed": lambda: current_window(cfg["meal_windows"]) is None,
+        }
+
+    registry = DeviceRegistry(devices, checkpoints, handle_log_batch,
+                              max_workers=cfg["device_pool_size"],
+                              scheduler_factory=make_scheduler,
+                              rotation_factory=make_rotation)
+    registry.run()
 
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok"})
 
+@app.route("/devices", methods=["GET"])
+def devices_status():
+    """
+    Per-device ingestion status (connection, failures, last poll)
+    """
+    if registry is None:
+        return jsonify({"devices": [{"name": name, "ip": d.ip, "port": d.port}
+                                    for name, d, _ in devices]})
+    return jsonify({"devices": registry.status(), "user_directory": user_directory.stats()})
+
+@app.route("/pipeline", methods=["GET"])
+def pipeline_status():
+    """
+    Scan pipeline queue depths and counters
+    """
+    init_services()
+    stats = pipeline.stats()
+    if journal is not None:
+        stats["journal"] = journal.stats()
+    return jsonify(stats)
+
+def queue_print(method, kwargs, student_id=None):
+    """
+    Queue a print job and answer 202 with its id, or 503 with Retry-After
+    when the print queues are full.
+    """
+    job = PrintJob(method, kwargs, student_id=student_id)
+    if not pipeline.try_submit_print(job):
+        stats = pipeline.stats()
+        response = jsonify({"error": "Print queue full", "queue_depths": stats["print_queue_depths"],
+                            "queue_capacity": stats["print_queue_capacity"]})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+    response = jsonify({"job_id": job.job_id, "status": job.status,
+                        "status_url": f"/print-jobs/{job.job_id}"})
+    response.headers["Location"] = f"/print-jobs/{job.job_id}"
+    return response, 202
+
+@app.route("/print-jobs/<job_id>", methods=["GET"])
+def print_job_status(job_id):
+    """
+    Status of a queued print job
+    """
+    init_services()
+    job = pipeline.job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown print job"}), 404
+    return jsonify(job.as_dict())
+
 @app.route("/test-print", methods=["POST"])
 def test_print():
     # Initialize services if not already done
@@ -222,8 +736,8 @@ def test_print():
     student_name = payload.get("name", "Test Student")
     student_id = payload.get("id", "000")
     details = payload.get("details", "Test printing")
-    ok = printer.print_ticket(student_name, student_id, details)
-    return jsonify({"printed": ok})
+    return queue_print("print_ticket", {"student_name": student_name, "student_id": student_id,
+                                        "details": details}, student_id=student_id)
 
 @app.route("/test-error", methods=["POST"])
 def test_error():
@@ -236,8 +750,7 @@ def test_error():
     payload = request.json or {}
     message = payload.get("message", "Test error message")
     photo_url = payload.get("photo_url")
-    ok = printer.print_error(message, photo_url=photo_url)
-    return jsonify({"printed": ok})
+    return queue_print("print_error", {"message": message, "photo_url": photo_url})
 
 @app.route("/admin", methods=["GET"])
 def admin():
@@ -248,8 +761,11 @@ def admin():
     
     # System status data
     middleware_status = "running"
-    device_status = "connected" if zk and hasattr(zk, '_connected') and zk._connected else "disconnected"
-    printer_status = "ready" if printer and printer.printer else "not available"
+    device_status = zk.state if zk is not None else "disconnected"
+    if printer is None:
+        printer_status = "not available"
+    else:
+        printer_status = "ready" if printer.state == "connected" else printer.state.replace("_", " ")
     
     # Device information
     device_model = "SpeedFace M4 (Simulated)"
@@ -299,6 +815,85 @@ def student_fees(student_id):
         logger.exception("Error checking student fees: %s", e)
         return jsonify({"paid": False, "details": "Internal server error"}), 500
 
+@app.route("/students/fees:batch", methods=["POST"])
+def student_fees_batch():
+    """
+    Payment status for several students in one call
+    Body: { "student_ids": ["1001", "1002"] }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        student_ids = data.get("student_ids")
+        if not isinstance(student_ids, list) or not student_ids:
+            return jsonify({"error": "student_ids must be a non-empty list"}), 400
+        if len(student_ids) > 500:
+            return jsonify({"error": "At most 500 student_ids per request"}), 400
+        return jsonify({"results": check_payments(student_ids)})
+    except Exception as e:
+        logger.exception("Error checking student fees batch: %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route("/students/<student_id>/fees/invalidate", methods=["POST"])
+def invalidate_student_fees(student_id):
+    """
+    Webhook/admin endpoint: drop a student's cached payment status,
+    e.g. when the school system posts a new payment
+    """
+    token = api_cfg.get("webhook_token")
+    if token and request.headers.get("X-Webhook-Token") != token:
+        return jsonify({"error": "Unauthorized"}), 401
+    removed = payment_cache.invalidate(str(student_id))
+    if fee_ledger is not None:
+        fee_ledger.forget(str(student_id))
+    logger.info("Payment cache invalidated for %s (cached=%s)", student_id, removed)
+    return jsonify({"student_id": student_id, "invalidated": removed})
+
+@app.route("/cache/payments", methods=["GET"])
+def payment_cache_stats():
+    """
+    Payment cache size and hit/miss counters
+    """
+    stats = payment_cache.stats()
+    stats["coalescing"] = payment_lookups.stats()
+    stats["circuit"] = school_api_breaker.stats()
+    stats["school_api"] = school_api.stats()
+    stats["prefetch"] = prefetcher.stats()
+    if fee_ledger is not None:
+        stats["fee_ledger"] = fee_ledger.stats()
+    return jsonify(stats)
+
+@app.route("/cache/photos", methods=["GET"])
+def photo_cache_stats():
+    """
+    Student photo cache size and hit/download counters
+    """
+    if photo_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(photo_cache.stats(), enabled=True))
+
+@app.route("/rules", methods=["GET"])
+def rules_status():
+    """
+    Active meal eligibility rules and today's meal counts
+    """
+    return jsonify(meal_rules.stats())
+
+@app.route("/rules/reload", methods=["POST"])
+def reload_rules():
+    """
+    Recompile the meal rules from MEAL_RULES_FILE now
+    """
+    reloaded = meal_rules.reload(force=True)
+    return jsonify({"reloaded": reloaded, "error": meal_rules.last_error})
+
+@app.route("/cache/payments/prefetch", methods=["POST"])
+def prefetch_payments():
+    """
+    Warm the payment cache for every student now
+    """
+    count = prefetcher.run_once()
+    return jsonify({"prefetched": count, "error": prefetcher.last_error})
+
 @app.route("/attendance", methods=["POST"])
 def log_attendance():
     """
@@ -345,12 +940,9 @@ def print_ticket():
             return jsonify({"error": "student_id is required"}), 400
             
         details = f"{meal_type} - R{amount:.2f}"
-        ok = printer.print_ticket(student_name, student_id, details, photo_url=photo_url)
-        
-        if ok:
-            return jsonify({"message": "Ticket printed successfully"}), 200
-        else:
-            return jsonify({"error": "Failed to print ticket"}), 500
+        return queue_print("print_ticket", {"student_name": student_name, "student_id": student_id,
+                                            "details": details, "photo_url": photo_url},
+                           student_id=student_id)
     except Exception as e:
         logger.exception("Error printing ticket: %s", e)
         return jsonify({"error": "Internal server error"}), 500
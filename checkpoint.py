@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def log_timestamp(log):
+    """
+    Return the timestamp of an attendance log (object or tuple shaped).
+    """
+    if hasattr(log, 'timestamp'):
+        return log.timestamp
+    return log[1]
+
+
+def log_user_id(log):
+    """
+    Return the user/student id of an attendance log as a string.
+    """
+    if hasattr(log, 'user_id'):
+        return str(log.user_id)
+    return str(log[0])
+
+
+def _ts_to_str(ts):
+    if isinstance(ts, datetime):
+        return ts.isoformat()
+    return str(ts)
+
+
+class AttendanceCheckpoint:
+    """
+    Durable per-device high-water mark for attendance ingestion.
+
+    For each device we remember the timestamp of the newest processed record,
+    the user ids seen at exactly that timestamp (several faces can be scanned
+    within the same second) and the device record count at the time of the
+    last pull. The state is written to a small JSON file with an atomic
+    rename so it survives restarts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Could not read checkpoint file %s: %s", self.path, e)
+        return {}
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def get(self, device_key):
+        """Return the checkpoint dict for a device, or None if never pulled."""
+        with self._lock:
+            entry = self._state.get(device_key)
+            return dict(entry) if entry else None
+
+    def is_new(self, device_key, log):
+        """True if the log is newer than the device's checkpoint."""
+        entry = self.get(device_key)
+        return is_after(entry, log)
+
+    def advance(self, device_key, logs, record_count=None):
+        """
+        Move the device checkpoint past the given (already processed) logs.
+        """
+        with self._lock:
+            entry = dict(self._state.get(device_key) or {})
+            last_ts = entry.get("timestamp")
+            last_ids = set(entry.get("user_ids", []))
+            changed = False
+            for log in logs:
+                ts = _ts_to_str(log_timestamp(log))
+                uid = log_user_id(log)
+                if last_ts is None or ts > last_ts:
+                    last_ts = ts
+                    last_ids = {uid}
+                    changed = True
+                elif ts == last_ts and uid not in last_ids:
+                    last_ids.add(uid)
+                    changed = True
+            if record_count is not None and record_count != entry.get("records"):
+                entry["records"] = record_count
+                changed = True
+            if not changed:
+                return
+            entry["timestamp"] = last_ts
+            entry["user_ids"] = sorted(last_ids)
+            self._state[device_key] = entry
+            try:
+                self._save()
+            except Exception as e:
+                logger.exception("Failed to persist checkpoint: %s", e)
+
+
+def is_after(entry, log):
+    """
+    True if the log sorts after the checkpoint entry (None means no checkpoint).
+    """
+    if not entry or entry.get("timestamp") is None:
+        return True
+    ts = _ts_to_str(log_timestamp(log))
+    if ts > entry["timestamp"]:
+        return True
+    if ts == entry["timestamp"]:
+        return log_user_id(log) not in entry.get("user_ids", [])
+    return False
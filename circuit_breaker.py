@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for an upstream dependency.
+
+    "closed": calls go through; `failure_threshold` consecutive failures
+    open the circuit. "open": allow() is False so callers answer from
+    local data instead of waiting on timeouts, and a background thread
+    runs `probe()` every `reset_timeout` seconds. A successful probe
+    closes the circuit again.
+    """
+
+    def __init__(self, name, probe, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._prober = None
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "closed" and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.time()
+        self.times_opened += 1
+        logger.warning("Circuit %s opened after %d failure(s)", self.name, self.failures)
+        if self._prober is None or not self._prober.is_alive():
+            self._prober = threading.Thread(target=self._probe_loop,
+                                            name=f"{self.name}-probe", daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.reset_timeout)
+            try:
+                ok = self.probe()
+            except Exception as e:
+                logger.debug("Circuit %s probe failed: %s", self.name, e)
+                ok = False
+            if ok:
+                with self._lock:
+                    self.state = "closed"
+                    self.failures = 0
+                    self.opened_at = None
+                logger.info("Circuit %s closed, upstream is reachable again", self.name)
+                return
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened_at": self.opened_at,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,130 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class DedupStore:
+    """
+    Two-tier store of already-processed attendance event ids.
+
+    The memory tier is an LRU/time window (bounded by `max_entries` and
+    `window_seconds`) so the hot path is a dict lookup. The disk tier is a
+    SQLite table keyed by event id, which keeps dedup state across restarts
+    so records still on the device are not processed (and printed) again.
+    Disk entries older than `retention_seconds` are pruned periodically.
+    """
+
+    def __init__(self, path, window_seconds=3600, max_entries=10000,
+                 retention_seconds=7 * 24 * 3600):
+        self.path = path
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.retention_seconds = retention_seconds
+        self._lock = threading.RLock()
+        self._recent = OrderedDict()
+        self._last_prune = 0.0
+        self._db = None
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen_events ("
+                "event_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_seen_events_seen_at ON seen_events(seen_at)"
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.exception("Failed to open dedup store %s, using memory only: %s", path, e)
+            self._db = None
+
+    def _expire_memory(self, now):
+        cutoff = now - self.window_seconds
+        while self._recent:
+            event_id, seen_at = next(iter(self._recent.items()))
+            if seen_at >= cutoff and len(self._recent) <= self.max_entries:
+                break
+            self._recent.popitem(last=False)
+
+    def _seen_on_disk(self, event_id):
+        if self._db is None:
+            return False
+        try:
+            row = self._db.execute(
+                "SELECT 1 FROM seen_events WHERE event_id = ?", (event_id,)
+            ).fetchone()
+            return row is not None
+        except Exception as e:
+            logger.exception("Dedup store lookup failed: %s", e)
+            return False
+
+    def _prune_disk(self, now):
+        if self._db is None or now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        try:
+            self._db.execute(
+                "DELETE FROM seen_events WHERE seen_at < ?", (now - self.retention_seconds,)
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.exception("Dedup store prune failed: %s", e)
+
+    def contains(self, event_id):
+        """True if the event id has already been recorded."""
+        now = time.time()
+        with self._lock:
+            if event_id in self._recent:
+                self._recent[event_id] = now
+                self._recent.move_to_end(event_id)
+                return True
+            if self._seen_on_disk(event_id):
+                self._recent[event_id] = now
+                self._expire_memory(now)
+                return True
+            return False
+
+    def add(self, event_id):
+        """Record an event id as processed."""
+        now = time.time()
+        with self._lock:
+            self._recent[event_id] = now
+            self._recent.move_to_end(event_id)
+            self._expire_memory(now)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO seen_events (event_id, seen_at) VALUES (?, ?)",
+                        (event_id, now),
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.exception("Dedup store write failed: %s", e)
+            self._prune_disk(now)
+
+    def add_if_new(self, event_id):
+        """
+        Atomically check and record an event id.
+        Returns True if the event was new, False if it was a duplicate.
+        """
+        with self._lock:
+            if event_id in self._recent or self._seen_on_disk(event_id):
+                return False
+            self.add(event_id)
+            return True
+
+    def __len__(self):
+        with self._lock:
+            return len(self._recent)
+
+    def __contains__(self, event_id):
+        return self.contains(event_id)
@@ -72,8 +72,8 @@ def demo_complete_workflow():
                                    "amount": student_data['amount'],
                                    "photo_url": student_data['photo_url']
                                })
-        if response.status_code == 200:
-            print("   ✅ Meal card printed successfully with student image")
+        if response.status_code == 202:
+            print(f"   ✅ Meal card with student image queued (job {response.json()['job_id']})")
         else:
             print(f"   ❌ Error: {response.status_code}")
     except Exception as e:
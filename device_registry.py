@@ -0,0 +1,177 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ingestion import DeviceIngestor
+
+logger = logging.getLogger(__name__)
+
+
+def parse_devices(spec, default_port=4370, default_timeout=10):
+    """
+    Parse a DEVICES specification into a list of device config dicts.
+
+    Entries are comma separated, each `[name@]ip[:port]`, e.g.
+    "lane1@192.168.1.100:4370,lane2@192.168.1.101".
+    """
+    devices = []
+    for i, item in enumerate(p.strip() for p in spec.split(",")):
+        if not item:
+            continue
+        name = None
+        if "@" in item:
+            name, item = item.split("@", 1)
+        ip, _, port = item.partition(":")
+        devices.append({
+            "name": name or f"device{i + 1}",
+            "ip": ip,
+            "port": int(port) if port else default_port,
+            "timeout": default_timeout,
+        })
+    return devices
+
+
+class DeviceEntry:
+    """Per-device scheduling state"""
+
+    def __init__(self, name, device, ingestor, poll_interval, scheduler=None):
+        self.name = name
+        self.device = device
+        self.ingestor = ingestor
+        self.poll_interval = poll_interval
+        self.scheduler = scheduler
+        self.next_due = 0.0
+        self.failures = 0
+        self.busy = False
+        self.last_poll = None
+        self.last_error = None
+
+    def status(self):
+        return {
+            "name": self.name,
+            "ip": self.device.ip,
+            "port": self.device.port,
+            "mode": self.ingestor.mode,
+            "poll_interval": self.poll_interval,
+            "schedule": self.scheduler.mode() if self.scheduler else "fixed",
+            "connected": bool(self.device._connected),
+            "connection": self.device.connection_state(),
+            "failures": self.failures,
+            "last_poll": self.last_poll,
+            "last_error": self.last_error,
+        }
+
+
+class DeviceRegistry:
+    """
+    Runs ingestion for several devices concurrently.
+
+    Each device has its own connection, checkpoint key, backoff state and
+    poll cadence. Poll-mode devices are scheduled onto a bounded thread pool
+    with at most one poll in flight per device, so a slow or unreachable
+    terminal only ever ties up one worker. Live-mode devices hold a
+    dedicated worker for their stream.
+    """
+
+    def __init__(self, devices, checkpoints, handler, max_workers=4,
+                 backoff_base=2, backoff_max=60, tick=0.1, scheduler_factory=None,
+                 rotation_factory=None):
+        """
+        devices: list of (name, ZKDevice, device_cfg) tuples
+        handler: callable(logs, device) invoked with each batch of new records
+        scheduler_factory: optional callable returning an AdaptivePollScheduler
+            per device; without it each device polls at its fixed poll_interval
+        rotation_factory: optional callable(name, device) returning the
+            DeviceIngestor rotation settings for a device (None disables it)
+        """
+        self.checkpoints = checkpoints
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tick = tick
+        self.entries = []
+        for name, device, dcfg in devices:
+            ingestor = DeviceIngestor(
+                device, checkpoints,
+                lambda logs, d=device: handler(logs, d),
+                key=f"{device.ip}:{device.port}",
+                mode=dcfg.get("ingestion_mode", "poll"),
+                poll_interval=dcfg.get("poll_interval", 3),
+                rotation=rotation_factory(name, device) if rotation_factory else None,
+            )
+            scheduler = scheduler_factory() if scheduler_factory else None
+            self.entries.append(DeviceEntry(name, device, ingestor, ingestor.poll_interval, scheduler))
+        live_count = sum(1 for e in self.entries if e.ingestor.mode == "live")
+        # Live streams each pin a worker; keep room for the pollers
+        self.max_workers = max(max_workers, live_count + 1)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _backoff(self, failures):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (failures - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _poll(self, entry):
+        try:
+            if not entry.device.ensure_connected():
+                # ZKDevice spaces its own reconnects; come back when it is due
+                # rather than stacking a second backoff on top
+                with self._lock:
+                    entry.last_error = entry.device.last_error or "device not reachable"
+                    entry.next_due = max(entry.device.next_attempt, time.monotonic() + self.tick)
+                return
+            count = entry.ingestor.poll_once()
+            if not entry.device._connected:
+                raise ConnectionError("connection lost during poll")
+            if entry.scheduler is not None:
+                entry.scheduler.record_scans(count)
+                entry.poll_interval = entry.scheduler.next_interval()
+            with self._lock:
+                entry.failures = 0
+                entry.last_error = None
+                entry.last_poll = time.time()
+                entry.next_due = time.monotonic() + entry.poll_interval
+        except Exception as e:
+            with self._lock:
+                entry.failures += 1
+                entry.last_error = str(e)
+                delay = self._backoff(entry.failures)
+                entry.next_due = time.monotonic() + delay
+            logger.warning("Poll failed on %s (%s), retrying in %.1fs", entry.name, e, delay)
+        finally:
+            with self._lock:
+                entry.busy = False
+
+    def run(self):
+        """Schedule device ingestion until stop() is called (blocking)."""
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="zk-device")
+        for entry in self.entries:
+            if entry.ingestor.mode == "live":
+                self._executor.submit(entry.ingestor.run_live)
+        logger.info("Device registry started with %d device(s)", len(self.entries))
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                for entry in self.entries:
+                    if entry.ingestor.mode == "live":
+                        continue
+                    with self._lock:
+                        if entry.busy or now < entry.next_due:
+                            continue
+                        entry.busy = True
+                    self._executor.submit(self._poll, entry)
+                self._stop.wait(self.tick)
+        finally:
+            for entry in self.entries:
+                entry.ingestor.stop()
+            self._executor.shutdown(wait=False)
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        with self._lock:
+            return [e.status() for e in self.entries]
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# States after which an event needs no more work
+TERMINAL_STATES = ("printed", "failed", "skipped")
+
+
+class JournalError(IOError):
+    """Journal records could not be made durable"""
+
+
+class EventJournal:
+    """
+    Append-only write-ahead journal of scan event state transitions.
+
+    Each line is a JSON record {"id", "state", "ts", "data"}; states are
+    "received" -> "decided" -> "printed" (or "failed" / "skipped").
+    Appends are handed to a writer thread that writes everything queued so
+    far and fsyncs once (group commit), so concurrent and batched appends
+    share a single fsync. `append(..., wait=True)` returns once the record
+    is durable, and raises JournalError if its write or fsync failed.
+
+    On open, the journal is replayed and events that never reached a
+    terminal state are available from pending() so the caller can finish
+    them. The file is compacted down to the open events once it exceeds
+    `compact_bytes`.
+    """
+
+    def __init__(self, path, flush_interval=0.005, compact_bytes=5 * 1024 * 1024):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_bytes = compact_bytes
+        self._open = {}
+        self._queue = []
+        self._cond = threading.Condition()
+        self._appended_seq = 0
+        # Waiting appenders: {"seq", "done", "error"}
+        self._waiters = []
+        # A failed write may leave a partial line behind
+        self._torn = False
+        self._closed = False
+        self.fsyncs = 0
+        self.records = 0
+        self.write_errors = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._file = open(path, "a")
+        self._thread = threading.Thread(target=self._writer, name="event-journal", daemon=True)
+        self._thread.start()
+
+    def _replay(self):
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash mid-write
+                        continue
+                    self._apply(record)
+        except FileNotFoundError:
+            return
+        if self._open:
+            logger.info("Event journal has %d unfinished event(s) to recover", len(self._open))
+
+    def _apply(self, record):
+        event_id = record["id"]
+        if record["state"] in TERMINAL_STATES:
+            self._open.pop(event_id, None)
+            return
+        entry = self._open.setdefault(event_id, {"id": event_id, "data": {}})
+        entry["state"] = record["state"]
+        entry["data"].update(record.get("data") or {})
+
+    def pending(self):
+        """Unfinished events as dicts {"id", "state", "data"}."""
+        with self._cond:
+            return [dict(e, data=dict(e["data"])) for e in self._open.values()]
+
+    def append(self, event_id, state, data=None, wait=True):
+        self.append_many([(event_id, state, data)], wait=wait)
+
+    def append_many(self, entries, wait=True):
+        """
+        Append (event_id, state, data) transitions. With wait=True, block
+        until they are fsynced; raises JournalError if that failed.
+        """
+        now = time.time()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("event journal is closed")
+            for event_id, state, data in entries:
+                record = {"id": str(event_id), "state": state, "ts": now}
+                if data:
+                    record["data"] = data
+                self._apply(record)
+                self._queue.append(record)
+            self._appended_seq += len(entries)
+            waiter = {"seq": self._appended_seq, "done": False, "error": None}
+            if wait:
+                self._waiters.append(waiter)
+            self._cond.notify_all()
+            if wait:
+                while not waiter["done"] and not self._closed:
+                    self._cond.wait()
+        if waiter["error"] is not None:
+            raise JournalError(f"event journal write failed: {waiter['error']}") from waiter["error"]
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue and self._closed:
+                    return
+            # Let concurrent appenders join this group commit
+            if self.flush_interval:
+                time.sleep(self.flush_interval)
+            with self._cond:
+                batch = self._queue
+                self._queue = []
+                seq = self._appended_seq
+            error = None
+            try:
+                # Start on a fresh line after a torn write; replay skips the blank
+                prefix = "\n" if self._torn else ""
+                self._file.write(prefix + "".join(json.dumps(r) + "\n" for r in batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._torn = False
+                self.fsyncs += 1
+                self.records += len(batch)
+            except Exception as e:
+                error = e
+                self._torn = True
+                self.write_errors += 1
+                logger.exception("Event journal write failed: %s", e)
+            with self._cond:
+                for waiter in self._waiters:
+                    if waiter["seq"] <= seq:
+                        waiter["done"] = True
+                        waiter["error"] = error
+                self._waiters = [w for w in self._waiters if not w["done"]]
+                self._cond.notify_all()
+            if error is not None:
+                continue
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        try:
+            if self._file.tell() < self.compact_bytes:
+                return
+            with self._cond:
+                if self._queue:
+                    return
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    for e in self._open.values():
+                        f.write(json.dumps({"id": e["id"], "state": e["state"],
+                                            "ts": time.time(), "data": e["data"]}) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._file.close()
+                os.replace(tmp_path, self.path)
+                self._file = open(self.path, "a")
+            logger.info("Event journal compacted to %d open event(s)", len(self._open))
+        except Exception as e:
+            logger.exception("Event journal compaction failed: %s", e)
+
+    def stats(self):
+        with self._cond:
+            return {"open_events": len(self._open), "records": self.records,
+                    "fsyncs": self.fsyncs, "write_errors": self.write_errors,
+                    "queued": len(self._queue)}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self._file.close()
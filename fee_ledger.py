@@ -0,0 +1,287 @@
+import base64
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Ids at or above this go to the dict: a bitset costs one bit per possible
+# id, so a 10-digit id would need a ~500 MB bitset (this cap is 128 KB)
+MAX_BIT_INDEX = 1 << 20
+
+
+class Bitset:
+    """Growable bitset keyed by non-negative integers"""
+
+    def __init__(self, data=b""):
+        self._bits = bytearray(data)
+
+    def get(self, i):
+        byte = i >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (i & 7)))
+
+    def set(self, i, value=True):
+        byte = i >> 3
+        if byte >= len(self._bits):
+            if not value:
+                return
+            self._bits.extend(b"\0" * (byte + 1 - len(self._bits)))
+        if value:
+            self._bits[byte] |= 1 << (i & 7)
+        else:
+            self._bits[byte] &= ~(1 << (i & 7)) & 0xFF
+
+    def count(self):
+        return sum(bin(b).count("1") for b in self._bits)
+
+    def to_bytes(self):
+        return bytes(self._bits)
+
+    def __len__(self):
+        return len(self._bits)
+
+
+class FeeLedger:
+    """
+    Local replica of the school fee ledger.
+
+    Paid status is kept in two bitsets indexed by numeric student id
+    ("known" and "paid"), so an eligibility check is an O(1) in-process bit
+    test and 100k students take about 25 KB. Non-numeric ids, and ids of
+    MAX_BIT_INDEX or more, fall back to a dict. Photo URLs are kept
+    alongside for tickets.
+
+    The replica is synced incrementally with an updated-since cursor (the
+    newest `last_payment_date` seen) and fully reloaded every
+    `full_sync_interval` to pick up paid -> unpaid changes. Delta syncs
+    can't see those, so a paid answer is only trusted while the last full
+    sync is recent enough (see is_fresh). It is persisted under STATE_DIR
+    so a restart does not need a full sync before it can answer.
+    """
+
+    def __init__(self, path, sync_interval=60, full_sync_interval=6 * 3600, max_lag=300):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.full_sync_interval = full_sync_interval
+        self.max_lag = max_lag
+        self._known = Bitset()
+        self._paid = Bitset()
+        self._other = {}
+        self._photos = {}
+        self._lock = threading.Lock()
+        self.cursor = None
+        self.synced_at = None
+        self.full_synced_at = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    @staticmethod
+    def _index(student_id):
+        try:
+            i = int(student_id)
+        except (TypeError, ValueError):
+            return None
+        return i if 0 <= i < MAX_BIT_INDEX else None
+
+    def _set(self, student_id, paid, known=None, paid_bits=None, other=None):
+        known = self._known if known is None else known
+        paid_bits = self._paid if paid_bits is None else paid_bits
+        other = self._other if other is None else other
+        i = self._index(student_id)
+        if i is None:
+            other[str(student_id)] = bool(paid)
+        else:
+            known.set(i)
+            paid_bits.set(i, bool(paid))
+
+    def lookup(self, student_id):
+        """True / False for a known student, None if the replica has no record."""
+        i = self._index(student_id)
+        if i is None:
+            return self._other.get(str(student_id))
+        if not self._known.get(i):
+            return None
+        return self._paid.get(i)
+
+    def result(self, student_id):
+        """A check_payment()-shaped result from the replica, or None."""
+        paid = self.lookup(student_id)
+        if paid is None:
+            return None
+        result = {
+            "student_id": str(student_id),
+            "paid": paid,
+            "details": "Lunch payment confirmed" if paid else "Lunch payment not found",
+            "source": "ledger",
+        }
+        photo_url = self._photos.get(str(student_id))
+        if photo_url:
+            result["photo_url"] = photo_url
+        return result
+
+    def forget(self, student_id):
+        """Drop one student (e.g. a payment just posted) until the next sync."""
+        with self._lock:
+            i = self._index(student_id)
+            if i is None:
+                self._other.pop(str(student_id), None)
+            else:
+                self._known.set(i, False)
+                self._paid.set(i, False)
+
+    def is_fresh(self, paid=False):
+        """
+        True if the last successful sync is within `max_lag` seconds. For a
+        paid answer the last full sync must also be within
+        `full_sync_interval + max_lag` seconds.
+        """
+        now = time.time()
+        if self.synced_at is None or now - self.synced_at > self.max_lag:
+            return False
+        if paid:
+            return self.full_synced_at is not None \
+                and now - self.full_synced_at <= self.full_sync_interval + self.max_lag
+        return True
+
+    def fresh_result(self, student_id):
+        """result() if the replica is fresh enough to answer it, else None."""
+        result = self.result(student_id)
+        if result is None or not self.is_fresh(paid=result["paid"]):
+            return None
+        return result
+
+    def apply(self, records):
+        """Merge fee records from the school API. Returns the count applied."""
+        count = 0
+        with self._lock:
+            for record in records:
+                student_id = record.get("student_id")
+                if student_id is None:
+                    continue
+                self._set(student_id, record.get("paid"))
+                if record.get("photo_url"):
+                    self._photos[str(student_id)] = record["photo_url"]
+                changed = record.get("last_payment_date")
+                if changed and (self.cursor is None or changed > self.cursor):
+                    self.cursor = changed
+                count += 1
+        return count
+
+    def _replace(self, records):
+        """Rebuild the replica from a full record set, then swap it in."""
+        known, paid_bits, other, photos = Bitset(), Bitset(), {}, {}
+        cursor = None
+        count = 0
+        for record in records:
+            student_id = record.get("student_id")
+            if student_id is None:
+                continue
+            self._set(student_id, record.get("paid"), known, paid_bits, other)
+            if record.get("photo_url"):
+                photos[str(student_id)] = record["photo_url"]
+            changed = record.get("last_payment_date")
+            if changed and (cursor is None or changed > cursor):
+                cursor = changed
+            count += 1
+        with self._lock:
+            self._known, self._paid, self._other, self._photos = known, paid_bits, other, photos
+            self.cursor = cursor
+        return count
+
+    def sync(self, client, full=False, per_page=500):
+        """
+        Pull changes (or everything) from the school API.
+        Returns the number of records applied.
+        """
+        full = full or self.cursor is None or self.full_synced_at is None \
+            or time.time() - self.full_synced_at >= self.full_sync_interval
+        try:
+            if full:
+                count = self._replace(list(client.iter_all_fees(per_page=per_page)))
+                self.full_synced_at = time.time()
+            else:
+                count = self.apply(list(client.iter_all_fees(per_page=per_page,
+                                                             updated_since=self.cursor)))
+            self.synced_at = time.time()
+            self.last_error = None
+            self._save()
+            if full or count:
+                logger.info("Fee ledger %s sync applied %d record(s)", "full" if full else "delta", count)
+            return count
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning("Fee ledger sync failed: %s", e)
+            return 0
+
+    def _save(self):
+        with self._lock:
+            state = {
+                "cursor": self.cursor,
+                "synced_at": self.synced_at,
+                "full_synced_at": self.full_synced_at,
+                "known": base64.b64encode(self._known.to_bytes()).decode("ascii"),
+                "paid": base64.b64encode(self._paid.to_bytes()).decode("ascii"),
+                "other": self._other,
+                "photos": self._photos,
+            }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("Could not read fee ledger %s: %s", self.path, e)
+            return
+        self._known = Bitset(base64.b64decode(state.get("known", "")))
+        self._paid = Bitset(base64.b64decode(state.get("paid", "")))
+        self._other = state.get("other", {})
+        self._photos = state.get("photos", {})
+        self.cursor = state.get("cursor")
+        self.synced_at = state.get("synced_at")
+        self.full_synced_at = state.get("full_synced_at")
+        logger.info("Loaded fee ledger replica (%d students)", self._known.count() + len(self._other))
+
+    def start(self, client, per_page=500):
+        """Keep the replica in sync in a background thread."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                self.sync(client, per_page=per_page)
+                self._stop.wait(self.sync_interval)
+
+        self._thread = threading.Thread(target=run, name="fee-ledger-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            known = self._known.count() + len(self._other)
+            paid = self._paid.count() + sum(1 for v in self._other.values() if v)
+            index_bytes = len(self._known) + len(self._paid)
+        return {
+            "students": known,
+            "paid": paid,
+            "index_bytes": index_bytes,
+            "cursor": self.cursor,
+            "synced_at": self.synced_at,
+            "full_synced_at": self.full_synced_at,
+            "fresh": self.is_fresh(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+
+from checkpoint import is_after
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceIngestor:
+    """
+    Feeds attendance records from one ZKDevice into a handler.
+
+    The handler is called with a list of new records: everything returned by
+    one poll at once, or a single event in live mode.
+
+    Two modes are supported:
+    - "poll": checkpointed pull_attendance() every poll interval
+    - "live": stream events with live_capture() as faces are scanned, and
+      fall back to a checkpointed poll whenever the stream drops, so no
+      record made while the stream was down is missed
+    """
+
+    def __init__(self, device, checkpoints, handler, key=None, mode="poll",
+                 poll_interval=3, retry_delay=5, rotation=None):
+        """
+        rotation: optional dict enabling device log rotation, with
+            "min_records" (rotate once the device holds this many records),
+            "archive_path" (JSON lines archive, optional) and
+            "allowed" (callable, rotation only runs while it returns True) and
+            "interval" (minimum seconds between rotation attempts)
+        """
+        self.device = device
+        self.checkpoints = checkpoints
+        self.handler = handler
+        self.key = key or f"{device.ip}:{device.port}"
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.rotation = rotation
+        self._last_rotation = 0.0
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _dispatch(self, logs):
+        self.handler(list(logs))
+
+    def poll_once(self, spaced=True):
+        """
+        Pull records newer than the checkpoint, dispatch them and advance the
+        checkpoint. Returns the number of records dispatched. With
+        spaced=False the device may not postpone the log download.
+        """
+        logs = self.device.pull_attendance(since=self.checkpoints.get(self.key), spaced=spaced)
+        if logs:
+            self._dispatch(logs)
+        self.checkpoints.advance(self.key, logs or [], record_count=self.device.last_record_count)
+        self._maybe_rotate()
+        return len(logs or [])
+
+    def _maybe_rotate(self):
+        """Clear the device log once it is large and fully committed."""
+        if not self.rotation:
+            return
+        count = self.device.last_record_count
+        if count is None or count < self.rotation.get("min_records", 1000):
+            return
+        allowed = self.rotation.get("allowed")
+        if allowed is not None and not allowed():
+            return
+        now = time.monotonic()
+        if now - self._last_rotation < self.rotation.get("interval", 300):
+            return
+        self._last_rotation = now
+        checkpoint = self.checkpoints.get(self.key)
+        cleared = self.device.rotate_attendance(
+            lambda l: not is_after(checkpoint, l),
+            archive_path=self.rotation.get("archive_path"),
+        )
+        if cleared:
+            self.checkpoints.advance(self.key, [], record_count=0)
+
+    def run_polling(self):
+        while not self._stop.is_set():
+            try:
+                self.device.ensure_connected()
+                self.poll_once()
+                self._stop.wait(self.poll_interval)
+            except Exception as e:
+                logger.exception("Polling loop error on %s: %s. Reconnecting...", self.key, e)
+                self.device.handle_error(e)
+                self._stop.wait(self.retry_delay)
+
+    def run_live(self):
+        while not self._stop.is_set():
+            try:
+                self.device.ensure_connected()
+                # Catch up on anything recorded while we were not streaming
+                self.poll_once(spaced=False)
+                stream = self.device.live_capture(timeout=self.poll_interval)
+                if stream is None:
+                    logger.warning("Live capture unavailable on %s, polling instead", self.key)
+                    self._stop.wait(self.poll_interval)
+                    continue
+                logger.info("Live capture started on %s", self.key)
+                try:
+                    for event in stream:
+                        if self._stop.is_set():
+                            break
+                        # None means the capture timed out without an event
+                        if event is None:
+                            continue
+                        self.handler([event])
+                        self.checkpoints.advance(self.key, [event],
+                                                 record_count=self._streamed_count())
+                finally:
+                    close = getattr(stream, 'close', None)
+                    if close:
+                        close()
+                # Ends when another thread needed the device; catch up and resume
+                logger.info("Live capture stream ended on %s, polling before resuming", self.key)
+            except Exception as e:
+                logger.exception("Live capture error on %s: %s. Reconnecting...", self.key, e)
+                self.device.handle_error(e)
+                self._stop.wait(self.retry_delay)
+
+    def _streamed_count(self):
+        """
+        Device record count after one more streamed event, if known. Keeping
+        it in step lets the catch-up poll after a paused stream skip the log
+        download when nothing else was recorded.
+        """
+        entry = self.checkpoints.get(self.key)
+        if not entry or entry.get("records") is None:
+            return None
+        count = entry["records"] + 1
+        self.device.last_record_count = count
+        return count
+
+    def run(self):
+        if self.mode == "live":
+            self.run_live()
+        else:
+            self.run_polling()
@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import yaml
+
+from meal_windows import current_window, parse_meal_windows
+
+logger = logging.getLogger(__name__)
+
+# Ticket text for each denial reason
+DENIAL_MESSAGES = {
+    "outside_meal_window": "No meal service at this time",
+    "unpaid": "Fee not paid for today's meal",
+    "balance_due": "Fee balance outstanding",
+    "not_found": "Student not registered for meals",
+    "daily_limit": "Meal allowance used for today",
+    "window_limit": "Meal already served this sitting",
+}
+
+
+class Decision:
+    """Outcome of evaluating the rules for one scan"""
+
+    def __init__(self, allowed, reason=None, window=None, grace=False):
+        self.allowed = allowed
+        self.reason = reason
+        self.window = window
+        self.grace = grace
+        # Day the meal was counted for (see MealRules.release)
+        self.counted_on = None
+
+    @property
+    def message(self):
+        return DENIAL_MESSAGES.get(self.reason, "Fee not paid for today's meal")
+
+    def as_dict(self):
+        return {"allowed": self.allowed, "reason": self.reason,
+                "window": self.window.name if self.window else None, "grace": self.grace}
+
+
+def _parse_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), "%Y-%m-%d").date()
+
+
+class RuleSet:
+    """
+    Meal eligibility rules compiled into a list of predicates.
+
+    Each predicate takes (student_id, payment, when, window, served) and returns a
+    denial reason or None; the first denial wins. Payment data comes from
+    check_payment() (cache / ledger / API), so evaluation itself does no I/O.
+    """
+
+    def __init__(self, config, default_windows):
+        config = config or {}
+        self.config = config
+        windows = config.get("meal_windows")
+        self.windows = parse_meal_windows(windows) if windows else default_windows
+        self.require_meal_window = bool(config.get("require_meal_window", False))
+        self.meals_per_day = int(config.get("meals_per_day") or 0)
+        self.meals_per_window = int(config.get("meals_per_window") or 0)
+        max_due = config.get("max_balance_due")
+        self.max_balance_due = float(max_due) if max_due is not None else None
+        # student_id -> last day of grace (None = until removed)
+        self.grace = {str(k): _parse_date(v) for k, v in (config.get("grace") or {}).items()}
+
+        self._predicates = []
+        if self.require_meal_window:
+            self._predicates.append(self._check_window)
+        self._predicates.append(self._check_payment)
+        if self.meals_per_day or self.meals_per_window:
+            self._predicates.append(self._check_quota)
+
+    def in_grace(self, student_id, when):
+        if student_id not in self.grace:
+            return False
+        until = self.grace[student_id]
+        return until is None or when.date() <= until
+
+    def _check_window(self, student_id, payment, when, window, served):
+        return None if window is not None else "outside_meal_window"
+
+    def _check_payment(self, student_id, payment, when, window, served):
+        if payment.get("paid") or self.in_grace(student_id, when):
+            return None
+        if payment.get("error") == "not_found":
+            return "not_found"
+        if self.max_balance_due is not None and payment.get("balance") is not None:
+            if float(payment["balance"]) <= self.max_balance_due:
+                return None
+            return "balance_due"
+        return "unpaid"
+
+    def _check_quota(self, student_id, payment, when, window, served):
+        day, by_window = served
+        if self.meals_per_day and day >= self.meals_per_day:
+            return "daily_limit"
+        if self.meals_per_window and window is not None \
+                and by_window.get(window.name, 0) >= self.meals_per_window:
+            return "window_limit"
+        return None
+
+    def evaluate(self, student_id, payment, when, served):
+        """served: (meals today, {window name: meals}) for the student."""
+        window = current_window(self.windows, when)
+        for predicate in self._predicates:
+            reason = predicate(student_id, payment, when, window, served)
+            if reason is not None:
+                return Decision(False, reason, window)
+        grace = not payment.get("paid") and self.in_grace(student_id, when)
+        return Decision(True, window=window, grace=grace)
+
+
+class MealRules:
+    """
+    The active RuleSet plus per-student meal counts.
+
+    Rules are read from a YAML file (`path`, optional) and recompiled when
+    the file changes, checked at most every `reload_interval` seconds, so
+    they can be edited without a deploy. An invalid file is logged and the
+    previous rules stay active. Meal counts are kept for the current day
+    only; with `state_path` every change is appended to that file (JSON
+    lines) and replayed on start, so a restart mid-meal does not reset the
+    limits. An allowed scan counts its meal straight away, so a second scan
+    can't slip in while the ticket prints; if the ticket then fails to
+    print, release() gives the meal back.
+    """
+
+    def __init__(self, default_windows, path=None, reload_interval=5, state_path=None):
+        self.default_windows = default_windows
+        self.path = path
+        self.reload_interval = reload_interval
+        self.rules = RuleSet({}, default_windows)
+        self.loaded_at = None
+        self.last_error = None
+        self._mtime = None
+        self._checked = 0.0
+        self._day = None
+        self._served = {}
+        self._lock = threading.Lock()
+        self.state_path = state_path
+        self._state_file = None
+        if state_path:
+            self._load_served()
+        self.reload()
+
+    def _load_served(self):
+        """Replay the most recent day's meal counts from state_path."""
+        lines = []
+        try:
+            with open(self.state_path, "r") as f:
+                for line in f:
+                    try:
+                        lines.append(json.loads(line))
+                    except ValueError:
+                        # Torn last line from a crash mid-write
+                        continue
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Could not read meal counts %s: %s", self.state_path, e)
+        day = max((l["day"] for l in lines), default=None)
+        lines = [l for l in lines if l["day"] == day]
+        for l in lines:
+            self._apply_count(l["student_id"], l.get("window"), l["delta"])
+        self._day = _parse_date(day)
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Rewrite without older days, then append to it
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            for l in lines:
+                f.write(json.dumps(l) + "\n")
+        os.replace(tmp_path, self.state_path)
+        self._state_file = open(self.state_path, "a")
+        if self._served:
+            logger.info("Restored meal counts for %d student(s) on %s", len(self._served), day)
+
+    def _apply_count(self, student_id, window_name, delta):
+        day, by_window = self._served.get(student_id, (0, {}))
+        by_window = dict(by_window)
+        if window_name is not None:
+            by_window[window_name] = max(0, by_window.get(window_name, 0) + delta)
+        day += delta
+        if day <= 0:
+            self._served.pop(student_id, None)
+        else:
+            self._served[student_id] = (day, by_window)
+
+    def _count(self, student_id, window, delta):
+        """Change a student's meal count for self._day. Caller holds the lock."""
+        window_name = window.name if window is not None else None
+        self._apply_count(student_id, window_name, delta)
+        if self._state_file is not None:
+            try:
+                self._state_file.write(json.dumps({
+                    "day": self._day.isoformat(), "student_id": student_id,
+                    "window": window_name, "delta": delta}) + "\n")
+                self._state_file.flush()
+            except Exception as e:
+                logger.error("Could not record meal count in %s: %s", self.state_path, e)
+
+    def reload(self, force=False):
+        """Recompile the rules if the file changed. Returns True if reloaded."""
+        if not self.path:
+            return False
+        self._checked = time.monotonic()
+        try:
+            mtime = os.path.getmtime(self.path)
+            if not force and mtime == self._mtime:
+                return False
+            with open(self.path, "r") as f:
+                rules = RuleSet(yaml.safe_load(f), self.default_windows)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error("Could not load meal rules from %s: %s", self.path, e)
+            return False
+        self.rules = rules
+        self._mtime = mtime
+        self.loaded_at = time.time()
+        self.last_error = None
+        logger.info("Loaded meal rules from %s", self.path)
+        return True
+
+    def _served_for(self, student_id, today):
+        if self._day != today:
+            self._day = today
+            self._served = {}
+            if self._state_file is not None:
+                # A new day: yesterday's counts are no longer needed
+                self._state_file.truncate(0)
+        return self._served.get(student_id, (0, {}))
+
+    def decide(self, student_id, payment, when=None):
+        """
+        Evaluate the rules for one scan and, if it is allowed, count the meal.
+        Returns a Decision; pass it to release() if the meal is not served.
+        """
+        when = when or datetime.now()
+        if self.path and time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+        student_id = str(student_id)
+        with self._lock:
+            day, by_window = self._served_for(student_id, when.date())
+            decision = self.rules.evaluate(student_id, payment, when, (day, by_window))
+            if decision.allowed:
+                self._count(student_id, decision.window, 1)
+                decision.counted_on = when.date()
+        return decision
+
+    def release(self, student_id, decision):
+        """Uncount a meal decide() counted but that was not served."""
+        student_id = str(student_id)
+        with self._lock:
+            counted_on, decision.counted_on = decision.counted_on, None
+            if counted_on is None or counted_on != self._day or student_id not in self._served:
+                return False
+            self._count(student_id, decision.window, -1)
+        return True
+
+    def stats(self):
+        rules = self.rules
+        with self._lock:
+            served = sum(day for day, _ in self._served.values())
+            students = len(self._served)
+        return {
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+            "require_meal_window": rules.require_meal_window,
+            "meal_windows": [repr(w) for w in rules.windows],
+            "meals_per_day": rules.meals_per_day,
+            "meals_per_window": rules.meals_per_window,
+            "max_balance_due": rules.max_balance_due,
+            "grace": len(rules.grace),
+            "meals_served_today": served,
+            "students_served_today": students,
+        }
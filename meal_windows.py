@@ -0,0 +1,58 @@
+from datetime import datetime, time as dtime, timedelta
+
+
+class MealWindow:
+    """A daily serving window, e.g. lunch 12:30-14:00"""
+
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start
+        self.end = end
+
+    def contains(self, when):
+        t = when.time()
+        if self.start <= self.end:
+            return self.start <= t < self.end
+        # Window crossing midnight
+        return t >= self.start or t < self.end
+
+    def next_start(self, when):
+        """Datetime of the next start of this window at or after `when`."""
+        start = datetime.combine(when.date(), self.start)
+        if start < when:
+            start += timedelta(days=1)
+        return start
+
+    def __repr__(self):
+        return f"MealWindow({self.name}, {self.start:%H:%M}-{self.end:%H:%M})"
+
+
+def _parse_time(value):
+    hour, minute = value.strip().split(":")
+    return dtime(int(hour), int(minute))
+
+
+def parse_meal_windows(spec):
+    """
+    Parse "breakfast=07:00-08:30,lunch=12:30-14:00" into MealWindows.
+    Names are optional ("12:30-14:00" is named "meal1").
+    """
+    windows = []
+    for i, item in enumerate(p.strip() for p in (spec or "").split(",")):
+        if not item:
+            continue
+        name = f"meal{i + 1}"
+        if "=" in item:
+            name, item = item.split("=", 1)
+        start, end = item.split("-", 1)
+        windows.append(MealWindow(name.strip(), _parse_time(start), _parse_time(end)))
+    return windows
+
+
+def current_window(windows, when=None):
+    """The meal window containing `when` (default now), or None."""
+    when = when or datetime.now()
+    for w in windows:
+        if w.contains(when):
+            return w
+    return None
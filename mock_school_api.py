@@ -4,7 +4,9 @@ Mock server for school management system API
 Simulates Kenyan student information and fee payment status
 """
 
+from datetime import date, datetime
 from flask import Flask, jsonify, request
+import hashlib
 import json
 
 app = Flask(__name__)
@@ -73,6 +75,57 @@ mock_student_data = {
     }
 }
 
+def check_auth():
+    """Return an error response if the request has no bearer token"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+@app.route("/api/students/fees", methods=["GET"])
+def get_all_student_fees():
+    """
+    Paginated fee payment status for every student (bulk prefetch).
+    ?updated_since=YYYY-MM-DD limits it to students whose last payment is
+    on or after that date (delta sync).
+    """
+    error = check_auth()
+    if error:
+        return error
+
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = min(1000, max(1, request.args.get("per_page", 100, type=int)))
+    updated_since = request.args.get("updated_since")
+    student_ids = sorted(
+        sid for sid, data in mock_student_data.items()
+        if not updated_since or (data.get("last_payment_date") or "") >= updated_since
+    )
+    start = (page - 1) * per_page
+    chunk = student_ids[start:start + per_page]
+    return jsonify({
+        "page": page,
+        "per_page": per_page,
+        "total": len(student_ids),
+        "next_page": page + 1 if start + per_page < len(student_ids) else None,
+        "students": [mock_student_data[sid] for sid in chunk]
+    })
+
+@app.route("/api/students/fees:batch", methods=["POST"])
+def get_student_fees_batch():
+    """Fee payment status for several students in one request"""
+    error = check_auth()
+    if error:
+        return error
+
+    payload = request.get_json(silent=True) or {}
+    student_ids = [str(sid) for sid in payload.get("student_ids", [])]
+    if len(student_ids) > 500:
+        return jsonify({"error": "At most 500 student_ids per request"}), 400
+    return jsonify({
+        "results": {sid: mock_student_data[sid] for sid in student_ids if sid in mock_student_data},
+        "not_found": [sid for sid in student_ids if sid not in mock_student_data]
+    })
+
 @app.route("/api/students/<student_id>/fees", methods=["GET"])
 def get_student_fees(student_id):
     """Get fee payment status for a student"""
@@ -86,7 +139,7 @@ def get_student_fees(student_id):
     # For this mock, we'll accept any key
     
     if student_id in mock_student_data:
-        return jsonify(mock_student_data[student_id])
+        return conditional_json(mock_student_data[student_id])
     else:
         return jsonify({
             "student_id": student_id,
@@ -96,6 +149,33 @@ def get_student_fees(student_id):
             "balance": 0.00
         }), 404
 
+def conditional_json(data):
+    """
+    JSON response with ETag / Last-Modified validators; answers 304 Not
+    Modified to a matching If-None-Match / If-Modified-Since.
+    """
+    response = jsonify(data)
+    response.set_etag(hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest())
+    if data.get("last_payment_date"):
+        response.last_modified = datetime.strptime(data["last_payment_date"], "%Y-%m-%d")
+    return response.make_conditional(request)
+
+@app.route("/api/students/<student_id>/fees/pay", methods=["POST"])
+def record_student_payment(student_id):
+    """Mark a student as paid (changes the record's validators)"""
+    error = check_auth()
+    if error:
+        return error
+    if student_id not in mock_student_data:
+        return jsonify({"error": "Student not found"}), 404
+    mock_student_data[student_id].update({
+        "paid": True,
+        "details": "Lunch payment confirmed",
+        "balance": 0.00,
+        "last_payment_date": date.today().isoformat(),
+    })
+    return jsonify(mock_student_data[student_id])
+
 @app.route("/api/students", methods=["GET"])
 def get_all_students():
     """Get all students (simplified list)"""
@@ -115,6 +195,8 @@ if __name__ == "__main__":
     print("Endpoints available:")
     print("  GET /api/health")
     print("  GET /api/students")
+    print("  GET /api/students/fees?page=1&per_page=100")
+    print("  POST /api/students/fees:batch")
     print("  GET /api/students/<student_id>/fees")
     print("Server running on http://localhost:8080")
     app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PaymentCache:
+    """
+    Bounded LRU cache of school API payment results with per-outcome TTLs.
+
+    Paid, unpaid and not-found results each get their own TTL (a paid
+    status rarely changes within a meal, an unpaid one may change as soon
+    as a payment posts). Error results are never cached. invalidate()
+    drops one student, e.g. when the school system reports a new payment.
+
+    Expired entries stay in the LRU until evicted so get_stale() can serve
+    the last known status while the school API is unavailable, and so their
+    HTTP validators (ETag / Last-Modified) can be used to revalidate them
+    with a conditional request; refresh() re-arms an entry after a 304.
+    """
+
+    def __init__(self, max_entries=5000, ttl_paid=3600, ttl_unpaid=300, ttl_not_found=600):
+        self.max_entries = max_entries
+        self.ttls = {
+            "paid": ttl_paid,
+            "unpaid": ttl_unpaid,
+            "not_found": ttl_not_found,
+        }
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+        self.revalidations = 0
+
+    @staticmethod
+    def classify(result):
+        """Outcome of a payment result: paid, unpaid, not_found or None (error)."""
+        error = result.get("error")
+        if error == "not_found":
+            return "not_found"
+        if error:
+            return None
+        return "paid" if result.get("paid") else "unpaid"
+
+    def get(self, student_id):
+        """Cached result for a student, or None on a miss or expired entry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(student_id)
+            self.hits += 1
+            return dict(entry[2])
+
+    def get_stale(self, student_id, max_age):
+        """
+        Last known result for a student, even if expired, as long as it was
+        fetched at most `max_age` seconds ago. Returns (result, age) or (None, None).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None or now - entry[1] > max_age:
+                return None, None
+            self.stale_hits += 1
+            return dict(entry[2]), now - entry[1]
+
+    def validators(self, student_id):
+        """HTTP validators stored with a student's entry (even expired), or None."""
+        with self._lock:
+            entry = self._entries.get(student_id)
+            return dict(entry[3]) if entry is not None and entry[3] else None
+
+    def refresh(self, student_id, ttl=None):
+        """
+        Restart the TTL of an entry the school API reported unchanged (304).
+        Returns the cached result, or None if the entry is gone.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None:
+                return None
+            ttl = self.ttls[self.classify(entry[2])] if ttl is None else ttl
+            self._entries[student_id] = (now + ttl, now, entry[2], entry[3])
+            self._entries.move_to_end(student_id)
+            self.revalidations += 1
+            return dict(entry[2])
+
+    def put(self, student_id, result, ttl=None, validators=None):
+        """
+        Cache a result according to its outcome (`ttl` overrides the outcome
+        TTL), with optional HTTP validators. Without validators, those of
+        the current entry are kept if its result is unchanged (e.g. the
+        same record from a batch or bulk fetch). Returns False if the result
+        is not cacheable.
+        """
+        kind = self.classify(result)
+        if kind is None:
+            return False
+        ttl = self.ttls[kind] if ttl is None else ttl
+        if ttl <= 0:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if not validators:
+                old = self._entries.get(student_id)
+                validators = old[3] if old is not None and old[2] == result else None
+            self._entries[student_id] = (now + ttl, now, dict(result), validators or None)
+            self._entries.move_to_end(student_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def reserve(self, count):
+        """Grow max_entries to hold at least `count` students. Returns True if grown."""
+        with self._lock:
+            if count <= self.max_entries:
+                return False
+            self.max_entries = count
+            return True
+
+    def invalidate(self, student_id):
+        """Drop one student's cached status. Returns True if it was cached."""
+        with self._lock:
+            self.invalidations += 1
+            return self._entries.pop(student_id, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_hits": self.stale_hits,
+                "revalidations": self.revalidations,
+                "ttls": dict(self.ttls),
+            }
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+def raster_command(image):
+    """
+    ESC/POS "GS v 0" raster bit image for a PIL image, dithered to 1 bit.
+    The bytes can be written to the printer as is.
+    """
+    image = image.convert("L").convert("1")
+    width, height = image.size
+    row_bytes = (width + 7) // 8
+    # PIL packs white as 1; the printer wants 1 for a black dot
+    data = bytearray(b ^ 0xFF for b in image.tobytes())
+    pad_bits = row_bytes * 8 - width
+    if pad_bits:
+        mask = (0xFF << pad_bits) & 0xFF
+        for row in range(height):
+            data[row * row_bytes + row_bytes - 1] &= mask
+    header = b"\x1dv0\x00" + bytes([row_bytes & 0xFF, row_bytes >> 8, height & 0xFF, height >> 8])
+    return header + bytes(data)
+
+
+class PhotoCache:
+    """
+    On-disk cache of student photos, stored ready to print.
+
+    Each photo is downloaded once, resized to `size`, dithered to 1 bit and
+    saved as an ESC/POS raster command, so printing it is a local byte
+    copy. Files are content addressed (named by the SHA-256 of the raster,
+    so identical photos share one file); an index maps each photo URL to
+    its file and HTTP validator (ETag / Last-Modified), and warm()
+    revalidates known URLs with a conditional GET. The total size is kept
+    under `max_bytes` by evicting the least recently used URLs.
+
+    Storing a photo is O(1): the index keeps LRU order, a running byte
+    total and per-file reference counts, and is written to disk at most
+    every `save_interval` seconds (and when the warm queue drains).
+    """
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, size=(100, 100), timeout=5,
+                 save_interval=5):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.timeout = timeout
+        self.save_interval = save_interval
+        self.session = requests.Session()
+        self._index_path = os.path.join(directory, "index.json")
+        # url -> {"digest", "bytes", "validator", "used"}, least recently used first
+        self._index = OrderedDict()
+        # digest -> number of URLs using that file
+        self._refs = {}
+        self._total = 0
+        self._dirty = False
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.downloads = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.raster")
+
+    def _load(self):
+        try:
+            with open(self._index_path, "r") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        except Exception as e:
+            logger.warning("Could not read photo cache index %s: %s", self._index_path, e)
+            index = {}
+        for url, entry in sorted(index.items(), key=lambda item: item[1]["used"]):
+            if os.path.exists(self._path(entry["digest"])):
+                self._index[url] = entry
+                self._ref(entry)
+        # Files left behind by a crash before the index was saved
+        for name in os.listdir(self.directory):
+            if name.endswith(".raster") and name[:-len(".raster")] not in self._refs:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _ref(self, entry):
+        digest = entry["digest"]
+        if digest not in self._refs:
+            self._refs[digest] = 0
+            self._total += entry["bytes"]
+        self._refs[digest] += 1
+
+    def _unref(self, entry):
+        """Drop one reference; returns the digest if its file is now unused."""
+        digest = entry["digest"]
+        self._refs[digest] -= 1
+        if self._refs[digest]:
+            return None
+        del self._refs[digest]
+        self._total -= entry["bytes"]
+        return digest
+
+    def _save(self):
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                index = {url: dict(e) for url, e in self._index.items()}
+                self._dirty = False
+                self._saved_at = time.monotonic()
+            tmp_path = f"{self._index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self._index_path)
+
+    def flush(self):
+        """Write the index now if it changed."""
+        self._save()
+
+    def get(self, url):
+        """Cached raster for a photo URL, or None."""
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry["used"] = time.time()
+            self._index.move_to_end(url)
+            digest = entry["digest"]
+        try:
+            with open(self._path(digest), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                if self._index.get(url) is entry:
+                    del self._index[url]
+                    self._unref(entry)
+                    self._dirty = True
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def raster(self, url):
+        """Raster for a photo URL: from disk, downloading it on a miss."""
+        if not url:
+            return None
+        data = self.get(url)
+        if data is None:
+            data = self.fetch(url)
+        return data
+
+    def fetch(self, url):
+        """
+        Download (or revalidate) a photo and store its raster.
+        Returns the raster bytes, or None if it could not be fetched.
+        """
+        if Image is None:
+            return None
+        with self._lock:
+            entry = self._index.get(url)
+            validator = dict(entry["validator"]) if entry and entry.get("validator") else {}
+        headers = {}
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+        try:
+            r = self.session.get(url, timeout=self.timeout, headers=headers)
+            if r.status_code == 304 and entry is not None:
+                with self._lock:
+                    self.not_modified += 1
+                return self.get(url)
+            if r.status_code != 200:
+                raise ValueError(f"HTTP {r.status_code}")
+            image = Image.open(BytesIO(r.content))
+            data = raster_command(image.resize(self.size))
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.warning("Failed to fetch student photo %s: %s", url, e)
+            return None
+        validator = {}
+        if r.headers.get("ETag"):
+            validator["etag"] = r.headers["ETag"]
+        if r.headers.get("Last-Modified"):
+            validator["last_modified"] = r.headers["Last-Modified"]
+        self._store(url, data, validator)
+        return data
+
+    def _store(self, url, data, validator):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        entry = {"digest": digest, "bytes": len(data), "validator": validator, "used": time.time()}
+        with self._lock:
+            orphans = []
+            old = self._index.pop(url, None)
+            if old is not None:
+                orphans.append(self._unref(old))
+            self._index[url] = entry
+            self._ref(entry)
+            self.downloads += 1
+            orphans += self._evict()
+            self._dirty = True
+            save = time.monotonic() - self._saved_at >= self.save_interval
+        for d in orphans:
+            if d is None or d == digest:
+                continue
+            try:
+                os.remove(self._path(d))
+            except OSError:
+                pass
+        if save:
+            self._save()
+
+    def _evict(self):
+        """
+        Drop least recently used URLs until under max_bytes (never the newest).
+        Returns the digests of files no longer used. Caller holds the lock.
+        """
+        orphans = []
+        while len(self._index) > 1 and self._total > self.max_bytes:
+            _, entry = self._index.popitem(last=False)
+            orphans.append(self._unref(entry))
+            self.evictions += 1
+        return orphans
+
+    def warm(self, url):
+        """Fetch or revalidate a photo in the background."""
+        if not url or Image is None:
+            return
+        with self._lock:
+            if url in self._queued:
+                return
+            self._queued.add(url)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="photo-cache", daemon=True)
+                self._thread.start()
+        self._queue.put(url)
+
+    def _run(self):
+        while True:
+            url = self._queue.get()
+            try:
+                self.fetch(url)
+            finally:
+                with self._lock:
+                    self._queued.discard(url)
+            if self._queue.empty():
+                try:
+                    self._save()
+                except Exception as e:
+                    logger.warning("Could not save photo cache index: %s", e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "photos": len(self._index),
+                "files": len(self._refs),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "downloads": self.downloads,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "queued": len(self._queued),
+            }
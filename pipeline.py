@@ -0,0 +1,222 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from printer_pool import PrinterPool
+
+logger = logging.getLogger(__name__)
+
+
+class ScanEvent:
+    """
+    A deduplicated scan waiting for a payment decision.
+    `deadline` is the time.monotonic() value its decision is due by.
+    """
+
+    def __init__(self, student_id, event_id, name="Unknown", device=None, deadline=None):
+        self.student_id = student_id
+        self.event_id = event_id
+        self.name = name
+        self.device = device
+        self.received_at = time.time()
+        self.deadline = deadline
+
+
+class PrintJob:
+    """
+    A print request produced by the decision stage or a print endpoint.
+    `method` is the TicketPrinter method name ("print_ticket" / "print_error"),
+    `on_done(ok)` is called after the job ran. `status` moves from "queued"
+    to "printing" to "printed" or "failed". `lane` (a device name) routes
+    the job to the printer of the same name when there is one.
+    """
+
+    def __init__(self, method, kwargs, student_id=None, on_done=None, lane=None):
+        self.job_id = uuid.uuid4().hex
+        self.method = method
+        self.kwargs = kwargs
+        self.student_id = student_id
+        self.on_done = on_done
+        self.lane = lane
+        # Names of the printers that have tried this job
+        self.printers = []
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def run(self, printer):
+        return getattr(printer, self.method)(**self.kwargs)
+
+    def as_dict(self):
+        return {
+            "job_id": self.job_id,
+            "method": self.method,
+            "student_id": self.student_id,
+            "lane": self.lane,
+            "printers": list(self.printers),
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ScanPipeline:
+    """
+    Staged ingestion -> decision -> print pipeline.
+
+    Ingestion threads submit ScanEvents onto a queue bounded to `queue_size`
+    scans, singly or as the batch of new scans from one poll (a batch larger
+    than the whole queue is still accepted once the queue is empty). A pool of decision workers runs
+    `decide(event)` (payment check), which returns a PrintJob or None; for a
+    batch, `prepare(events)` runs first so the batch can be looked up with
+    one upstream call. Print jobs go to a PrinterPool, where each printer
+    has its own bounded queue drained by a dedicated worker, so a slow
+    school API or printer never stops devices from being polled. When the
+    decision queue is full, submit() blocks the caller (the device poller)
+    instead of dropping scans; the time spent blocked is counted in stats().
+
+    try_submit_print() queues a job without blocking and returns False when
+    its printer's queue is full.
+    """
+
+    def __init__(self, decide, printers, queue_size=200, decision_workers=4,
+                 print_queue_size=50, prepare=None, printer_down_time=30,
+                 printer_probe_interval=10):
+        """printers: TicketPrinters, or (name, TicketPrinter) pairs"""
+        self.decide = decide
+        self.prepare = prepare
+        self.decision_workers = decision_workers
+        self.queue_size = queue_size
+        self._events = queue.Queue()
+        # Scans (not batches) waiting in _events, bounded by queue_size
+        self._queued = 0
+        self._room = threading.Condition()
+        named = [p if isinstance(p, tuple) else (f"printer{i + 1}", p) for i, p in enumerate(printers)]
+        self.printers = PrinterPool(named, queue_size=print_queue_size, down_time=printer_down_time,
+                                    probe_interval=printer_probe_interval)
+        self._threads = []
+        self._started = False
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "decided": 0,
+            "decision_errors": 0,
+            "backpressure_waits": 0,
+            "backpressure_seconds": 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.decision_workers):
+            t = threading.Thread(target=self._decision_worker, name=f"decision-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self.printers.start()
+        logger.info("Scan pipeline started: %d decision worker(s), %d printer worker(s)",
+                    self.decision_workers, len(self.printers))
+
+    def submit_batch(self, events, timeout=None):
+        """
+        Queue the new scans from one poll as a single work item, so they are
+        prepared together (see submit()).
+        """
+        if len(events) == 1:
+            return self.submit(events[0], timeout=timeout)
+        return self.submit(list(events), timeout=timeout)
+
+    def submit(self, event, timeout=None):
+        """
+        Queue a scan for a decision. Blocks while the queue is full (back-pressure).
+        Returns False only if `timeout` expired before there was room.
+        """
+        scans = len(event) if isinstance(event, list) else 1
+        with self._room:
+            if not self._has_room(scans):
+                self._count("backpressure_waits")
+                logger.debug("Scan queue full (%d), ingestion is waiting", self.queue_size)
+                started = time.monotonic()
+                ok = self._room.wait_for(lambda: self._has_room(scans), timeout)
+                self._count("backpressure_seconds", time.monotonic() - started)
+                if not ok:
+                    return False
+            self._queued += scans
+            self._events.put(event)
+        self._count("submitted", scans)
+        return True
+
+    def _has_room(self, scans):
+        return self._queued == 0 or self._queued + scans <= self.queue_size
+
+    def _decision_worker(self):
+        while True:
+            item = self._events.get()
+            try:
+                events = item if isinstance(item, list) else [item]
+                with self._room:
+                    self._queued -= len(events)
+                    self._room.notify_all()
+                if len(events) > 1 and self.prepare is not None:
+                    try:
+                        self.prepare(events)
+                    except Exception as e:
+                        logger.exception("Batch preparation failed: %s", e)
+                for event in events:
+                    self._decide(event)
+            finally:
+                self._events.task_done()
+
+    def _decide(self, event):
+        try:
+            job = self.decide(event)
+            self._count("decided")
+            if job is not None:
+                self._enqueue_print(job)
+        except Exception as e:
+            self._count("decision_errors")
+            logger.exception("Decision failed for %s: %s", event.student_id, e)
+
+    def submit_print(self, job):
+        """Queue a PrintJob directly (e.g. one recovered after a restart)."""
+        self.printers.submit(job)
+
+    def try_submit_print(self, job):
+        """
+        Queue a PrintJob without blocking. Returns False (back-pressure) if
+        its printer's queue is full; the job is then not tracked.
+        """
+        return self.printers.submit(job, block=False)
+
+    def job(self, job_id):
+        """A recent PrintJob by id, or None."""
+        return self.printers.job(job_id)
+
+    def _enqueue_print(self, job):
+        self.printers.submit(job)
+
+    def join(self):
+        """Wait until every queued scan has been decided and printed."""
+        self._events.join()
+        self.printers.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        with self._room:
+            stats["scan_queue_depth"] = self._queued
+        stats["scan_queue_capacity"] = self.queue_size
+        printers = self.printers.stats()
+        stats["printed"] = sum(p["printed"] for p in printers["printers"])
+        stats["print_failures"] = sum(p["failures"] for p in printers["printers"])
+        stats["print_rejected"] = printers["rejected"]
+        stats["print_queue_depths"] = [p["queue_depth"] for p in printers["printers"]]
+        stats["print_queue_capacity"] = self.printers.entries[0].jobs.maxsize if len(self.printers) else 0
+        stats["printers"] = printers["printers"]
+        return stats
@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from meal_windows import current_window
+
+
+class AdaptivePollScheduler:
+    """
+    Chooses the delay before a device's next poll.
+
+    - inside a configured meal window, or while recent scans show a rush:
+      `fast_interval` (sub-second)
+    - shortly after scans outside a window: `normal_interval`
+    - otherwise (idle): `idle_interval`
+    """
+
+    def __init__(self, meal_windows, fast_interval=0.5, normal_interval=3,
+                 idle_interval=30, rush_threshold=5, rush_window=60, cooldown=300):
+        self.meal_windows = meal_windows
+        self.fast_interval = fast_interval
+        self.normal_interval = normal_interval
+        self.idle_interval = idle_interval
+        self.rush_threshold = rush_threshold
+        self.rush_window = rush_window
+        self.cooldown = cooldown
+        self._scans = deque()
+        self._last_scan = None
+        self._lock = threading.Lock()
+
+    def record_scans(self, count, now=None):
+        """Record that a poll returned `count` new records."""
+        if count <= 0:
+            return
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self._scans.append((now, count))
+            self._last_scan = now
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._scans and self._scans[0][0] < now - self.rush_window:
+            self._scans.popleft()
+
+    def recent_scans(self, now=None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return sum(c for _, c in self._scans)
+
+    def mode(self, now=None, wall_clock=None):
+        """Current polling mode: rush, meal, active or idle."""
+        now = now if now is not None else time.monotonic()
+        if self.recent_scans(now) >= self.rush_threshold:
+            return "rush"
+        if current_window(self.meal_windows, wall_clock or datetime.now()) is not None:
+            return "meal"
+        with self._lock:
+            last_scan = self._last_scan
+        if last_scan is not None and now - last_scan < self.cooldown:
+            return "active"
+        return "idle"
+
+    def next_interval(self, now=None, wall_clock=None):
+        mode = self.mode(now, wall_clock)
+        if mode in ("rush", "meal"):
+            return self.fast_interval
+        if mode == "active":
+            return self.normal_interval
+        return self.idle_interval
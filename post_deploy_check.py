@@ -57,9 +57,9 @@ def check_test_print_endpoint(base_url):
             json={"name": "Test Student", "id": "000", "details": "Test printing"},
             timeout=10
         )
-        if response.status_code == 200:
+        if response.status_code == 202:
             data = response.json()
-            if "printed" in data:
+            if "job_id" in data:
                 print("✓ Test print endpoint is working")
                 return True
             else:
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentPrefetcher:
+    """
+    Warms the payment cache shortly before each meal window.
+
+    `lead_time` seconds before a window opens, the paid status (and photo
+    URL) of every student is pulled from the school API's paginated bulk
+    endpoint and stored in the cache, so the first scans of the rush are
+    decided locally. Paid results are kept until the window closes; other
+    outcomes use their normal cache TTL. If the school has more students
+    than the cache holds, the cache is grown to fit them (with a warning)
+    so the end of the pass does not evict its beginning.
+    """
+
+    def __init__(self, client, cache, meal_windows, lead_time=600, per_page=500,
+                 on_student=None):
+        """
+        on_student: optional callable(record) run for every prefetched
+            student (e.g. to warm other caches from the same pass)
+        """
+        self.client = client
+        self.cache = cache
+        self.meal_windows = meal_windows
+        self.lead_time = lead_time
+        self.per_page = per_page
+        self.on_student = on_student
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_run = None
+        self.last_count = 0
+        self.last_duration = None
+        self.last_error = None
+        # Start time of the window the last scheduled prefetch was for
+        self._done_start = None
+
+    def _window_end(self, window, now):
+        end = datetime.combine(now.date(), window.end)
+        if end <= now:
+            end += timedelta(days=1)
+        return end
+
+    def run_once(self, window=None):
+        """Prefetch every student now. Returns the number of students cached."""
+        with self._lock:
+            started = time.monotonic()
+            now = datetime.now()
+            paid_ttl = None
+            if window is not None:
+                paid_ttl = (self._window_end(window, now) - now).total_seconds()
+            count = 0
+            try:
+                for record in self.client.iter_all_fees(per_page=self.per_page,
+                                                        on_total=self._fit_cache):
+                    student_id = str(record.get("student_id", ""))
+                    if not student_id:
+                        continue
+                    ttl = paid_ttl if record.get("paid") else None
+                    self.cache.put(student_id, record, ttl=ttl)
+                    if self.on_student is not None:
+                        self.on_student(record)
+                    count += 1
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Payment prefetch failed after %d student(s): %s", count, e)
+            if count > self.cache.max_entries:
+                logger.warning("Prefetched %d students but the payment cache holds %d; "
+                               "raise PAYMENT_CACHE_SIZE", count, self.cache.max_entries)
+            self.last_run = now.isoformat()
+            self.last_count = count
+            self.last_duration = round(time.monotonic() - started, 2)
+            logger.info("Prefetched payment status for %d student(s) in %.2fs",
+                        count, self.last_duration)
+            return count
+
+    def _fit_cache(self, total):
+        limit = self.cache.max_entries
+        if self.cache.reserve(total):
+            logger.warning("Payment cache holds %d students but the school has %d; "
+                           "growing it for the prefetch (raise PAYMENT_CACHE_SIZE)", limit, total)
+
+    def next_run(self, now=None):
+        """
+        (run_at, window_start, window) of the next scheduled prefetch.
+        run_at may be in the past if we are already inside the lead time.
+        """
+        now = now or datetime.now()
+        best = (None, None, None)
+        for w in self.meal_windows:
+            start = w.next_start(now)
+            if start == self._done_start:
+                start += timedelta(days=1)
+            when = start - timedelta(seconds=self.lead_time)
+            if best[0] is None or when < best[0]:
+                best = (when, start, w)
+        return best
+
+    def start(self):
+        if self._thread is not None or not self.meal_windows:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                when, start, window = self.next_run()
+                delay = max(0.0, (when - datetime.now()).total_seconds())
+                logger.info("Next payment prefetch for %s at %s", window.name, when.strftime("%H:%M"))
+                if self._stop.wait(delay):
+                    break
+                self.run_once(window)
+                self._done_start = start
+
+        self._thread = threading.Thread(target=run, name="payment-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        when, _, window = self.next_run() if self.meal_windows else (None, None, None)
+        return {
+            "last_run": self.last_run,
+            "last_count": self.last_count,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "next_run": when.isoformat() if when else None,
+            "next_window": window.name if window else None,
+        }
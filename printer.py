@@ -1,5 +1,7 @@
 from escpos.printer import Network, Usb, File
 import logging
+import random
+import threading
 import time
 import requests
 from io import BytesIO
@@ -9,151 +11,221 @@ except ImportError:
     Image = None
     logging.warning("PIL not available, image printing will be disabled")
 
+from photo_cache import raster_command
+from ticket_templates import ALIGN, ERROR_TICKET, MEAL_TICKET, TicketTemplate
+
 logger = logging.getLogger(__name__)
 
+# DLE EOT real-time status requests
+STATUS_PRINTER = b"\x10\x04\x01"
+STATUS_OFFLINE = b"\x10\x04\x02"
+STATUS_PAPER = b"\x10\x04\x04"
+
+# Ticket layouts, compiled to ESC/POS bytes once at import
+MEAL_TICKET_TEMPLATE = TicketTemplate(MEAL_TICKET)
+ERROR_TICKET_TEMPLATE = TicketTemplate(ERROR_TICKET)
+
 class TicketPrinter:
-    def __init__(self, cfg):
+    """
+    Ticket printer with a managed connection.
+
+    The connection is (re)opened lazily with jittered exponential backoff,
+    so a printer that was off at startup or dropped mid-day comes back on
+    its own. probe() sends DLE EOT real-time status requests (network and
+    USB printers) to detect an offline printer, an open cover or paper
+    out; while any of those is reported, prints fail at once instead of
+    waiting for a socket timeout. `state` is one of "disconnected",
+    "connected", "backoff", "cover_open" or "paper_out".
+    """
+
+    def __init__(self, cfg, photo_cache=None, probe_timeout=1, backoff_base=1, backoff_max=60):
         self.cfg = cfg
         self.printer = None
+        # Optional PhotoCache with photos stored as ready-to-print rasters
+        self.photo_cache = photo_cache
+        self.probe_timeout = probe_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.state = "disconnected"
+        self.failures = 0
+        self.reconnects = 0
+        self.next_attempt = 0.0
+        self.last_error = None
+        self.last_probe = None
+        self.paper_near_end = False
+        self._lock = threading.RLock()
         self._connect()
 
     def _connect(self):
+        with self._lock:
+            if time.monotonic() < self.next_attempt:
+                # Still backing off after a failed attempt
+                return False
+            try:
+                if self.cfg.get("type") == "network":
+                    host = self.cfg["network"]["host"]
+                    port = self.cfg["network"].get("port", 9100)
+                    self.printer = Network(host, port=port, timeout=5)
+                    self.printer.open()
+                elif self.cfg.get("type") == "usb":
+                    # adjust ids for your printer
+                    self.printer = Usb(idVendor='0x04b8', idProduct='0x0202', timeout=5)
+                else:
+                    # fallback to file - use configurable file path or default
+                    file_path = self.cfg.get("file", "/tmp/meal_card.txt")
+                    self.printer = File(file_path)
+            except Exception as e:
+                logger.exception("Printer connection failed: %s", e)
+                self._failed(str(e))
+                return False
+            self.state = "connected"
+            if self.failures:
+                self.reconnects += 1
+            self.failures = 0
+            self.last_error = None
+            return True
+
+    def _failed(self, error):
+        """Drop the connection and back off before the next attempt."""
+        self._drop()
+        self.failures += 1
+        self.last_error = error
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (self.failures - 1)))
+        self.next_attempt = time.monotonic() + delay * random.uniform(0.5, 1.0)
+        self.state = "backoff"
+
+    def _drop(self):
         try:
-            if self.cfg.get("type") == "network":
-                host = self.cfg["network"]["host"]
-                port = self.cfg["network"].get("port", 9100)
-                self.printer = Network(host, port=port, timeout=5)
-            elif self.cfg.get("type") == "usb":
-                # adjust ids for your printer
-                self.printer = Usb(idVendor='0x04b8', idProduct='0x0202', timeout=5)
+            if self.printer is not None:
+                self.printer.close()
+        except Exception:
+            pass
+        self.printer = None
+        self.state = "disconnected"
+
+    def ensure_connected(self):
+        """Reconnect if needed (subject to backoff). True if connected."""
+        with self._lock:
+            if self.printer is not None:
+                return True
+            return self._connect()
+
+    def _query(self, command):
+        self.printer._raw(command)
+        data = self.printer._read()
+        if not data:
+            raise IOError("no status reply")
+        status = data[-1]
+        # Fixed bits of every DLE EOT reply: bit 1 and 4 set, bit 0 and 7 clear
+        if status & 0x93 != 0x12:
+            raise IOError(f"unexpected status byte 0x{status:02x}")
+        return status
+
+    def probe(self):
+        """
+        Reconnect if needed and read the printer's real-time status.
+        Returns True if the printer can print.
+        """
+        with self._lock:
+            if not self.ensure_connected():
+                return False
+            self.last_probe = time.time()
+            if self.cfg.get("type") not in ("network", "usb"):
+                return True
+            sock = getattr(self.printer, "device", None) if self.cfg.get("type") == "network" else None
+            try:
+                if sock is not None:
+                    sock.settimeout(self.probe_timeout)
+                offline = self._query(STATUS_PRINTER) & 0x08
+                cause = self._query(STATUS_OFFLINE) if offline else 0
+                paper = self._query(STATUS_PAPER)
+            except Exception as e:
+                logger.warning("Printer status probe failed: %s", e)
+                self._failed(f"status probe failed: {e}")
+                return False
+            finally:
+                if sock is not None and self.printer is not None:
+                    sock.settimeout(5)
+            self.paper_near_end = bool(paper & 0x0C)
+            if cause & 0x04:
+                self.state = "cover_open"
+            elif paper & 0x60 or cause & 0x20:
+                self.state = "paper_out"
             else:
-                # fallback to file - use configurable file path or default
-                file_path = self.cfg.get("file", "/tmp/meal_card.txt")
-                self.printer = File(file_path)
-        except Exception as e:
-            logger.exception("Printer connection failed: %s", e)
-            self.printer = None
+                self.state = "connected"
+            if self.state != "connected":
+                self.last_error = self.state.replace("_", " ")
+            return self.state == "connected"
 
-    def print_ticket(self, student_name, student_id, details, photo_url=None):
-        if not self.printer:
-            logger.error("No printer available")
-            return False
+    def ready(self):
+        """Last known status allows printing (no I/O beyond a reconnect)."""
+        return self.ensure_connected() and self.state == "connected"
+
+    def connection_state(self):
+        """Connection details for status reporting"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "last_probe": self.last_probe,
+            "paper_near_end": self.paper_near_end,
+            "retry_in": max(0.0, round(self.next_attempt - time.monotonic(), 1))
+            if self.state == "backoff" else 0.0,
+        }
+
+    def _photo_raster(self, photo_url):
+        """Centred ESC/POS raster of a student photo, or b"" if unavailable."""
+        if not photo_url or not Image:
+            return b""
         try:
-            p = self.printer
-            
-            # Set up the professional Kenya-themed meal card
-            
-            # Header with Kenya colors
-            p.set(align='center', width=2, height=2)
-            p.text("KENYA SCHOOL MEAL PROGRAM\n")
-            p.set(align='center', width=1, height=1)
-            p.text("Ministry of Education\n")
-            p.text("------------------------------\n")
-            
-            # Main title
-            p.set(align='center', width=1, height=1)
-            p.text("SCHOOL MEAL CARD\n")
-            p.text("==============================\n\n")
-            
-            # Print student photo if available and PIL is installed
-            if photo_url and Image:
-                try:
-                    response = requests.get(photo_url, timeout=5)
-                    if response.status_code == 200:
-                        image = Image.open(BytesIO(response.content))
-                        # Resize image to fit on receipt (about 100x100 pixels)
-                        image = image.resize((100, 100))
-                        p.image(image, center=True)
-                        p.text("\n")
-                except Exception as e:
-                    logger.warning("Failed to print student photo: %s", e)
-            
-            # Student information section
-            p.set(align='left', width=1, height=1)
-            p.text(f"Student Name: {student_name}\n")
-            p.text(f"Student ID:   {student_id}\n")
-            p.text(f"Meal Type:    {details}\n")
-            p.text(f"Date:         {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            # Status section
-            p.set(align='center', width=1, height=1)
-            p.text("STATUS: AUTHORIZED\n")
-            p.text("✔ MEAL APPROVED\n\n")
-            
-            # Motivational message
-            p.set(align='center', width=1, height=1)
-            p.text("""\n"Education is the most powerful weapon
-which you can use to change the world."
-- Nelson Mandela\n""")
-            
-            # Footer
-            p.text("\n==============================\n")
-            p.text("Enjoy your nutritious meal!\n")
-            p.text("Harambee! (Pull together)\n")
-            
-            # Cut the ticket
-            p.cut()
-            return True
+            if self.photo_cache is not None:
+                # Pre-rendered raster: a local byte copy (downloaded once on a miss)
+                raster = self.photo_cache.raster(photo_url)
+            else:
+                raster = None
+                response = requests.get(photo_url, timeout=5)
+                if response.status_code == 200:
+                    image = Image.open(BytesIO(response.content))
+                    # Resize image to fit on receipt (about 100x100 pixels)
+                    raster = raster_command(image.resize((100, 100)))
+            if raster:
+                return ALIGN["center"] + raster + b"\n"
         except Exception as e:
-            logger.exception("Printing failed: %s", e)
+            logger.warning("Failed to print student photo: %s", e)
+        return b""
+
+    def _write(self, data):
+        """Send a rendered ticket to the printer in one write."""
+        with self._lock:
+            if not self.ready():
+                logger.error("Printer not ready: %s", self.last_error or self.state)
+                return False
+            try:
+                self.printer._raw(data)
+                return True
+            except Exception as e:
+                logger.exception("Printing failed: %s", e)
+                self._failed(str(e))
+                return False
+
+    def print_ticket(self, student_name, student_id, details, photo_url=None):
+        if not self.ready():
+            logger.error("Printer not ready: %s", self.last_error or self.state)
             return False
+        return self._write(MEAL_TICKET_TEMPLATE.render(
+            student_name=student_name,
+            student_id=student_id,
+            details=details,
+            date=time.strftime('%Y-%m-%d %H:%M:%S'),
+            photo=self._photo_raster(photo_url),
+        ))
 
     def print_error(self, message, photo_url=None):
-        if not self.printer:
-            logger.error("No printer available")
+        if not self.ready():
+            logger.error("Printer not ready: %s", self.last_error or self.state)
             return False
-        try:
-            p = self.printer
-            
-            # Set up the professional Kenya-themed error card
-            
-            # Header with Kenya colors
-            p.set(align='center', width=2, height=2)
-            p.text("KENYA SCHOOL MEAL PROGRAM\n")
-            p.set(align='center', width=1, height=1)
-            p.text("Ministry of Education\n")
-            p.text("------------------------------\n")
-            
-            # Main title
-            p.set(align='center', width=1, height=1)
-            p.text("MEAL CARD - ACCESS DENIED\n")
-            p.text("==============================\n\n")
-            
-            # Print student photo if available and PIL is installed
-            if photo_url and Image:
-                try:
-                    response = requests.get(photo_url, timeout=5)
-                    if response.status_code == 200:
-                        image = Image.open(BytesIO(response.content))
-                        # Resize image to fit on receipt (about 100x100 pixels)
-                        image = image.resize((100, 100))
-                        p.image(image, center=True)
-                        p.text("\n")
-                except Exception as e:
-                    logger.warning("Failed to print student photo: %s", e)
-            
-            # Error message
-            p.set(align='center', width=1, height=1)
-            p.text("❌ ACCESS DENIED\n")
-            p.text(f"{message}\n\n")
-            
-            # Instructions
-            p.text("Please contact the school\n")
-            p.text("administration office to\n")
-            p.text("resolve this issue.\n\n")
-            
-            # Motivational message
-            p.set(align='center', width=1, height=1)
-            p.text("""\n"The future belongs to those\nwho believe in the beauty\nof their dreams."
-- Eleanor Roosevelt\n""")
-            
-            # Footer
-            p.text("\n==============================\n")
-            p.text("Harambee! (Pull together)\n")
-            
-            # Cut the ticket
-            p.cut()
-            return True
-        except Exception as e:
-            logger.exception("Printing error failed: %s", e)
-            return False
\ No newline at end of file
+        return self._write(ERROR_TICKET_TEMPLATE.render(
+            message=message,
+            photo=self._photo_raster(photo_url),
+        ))
@@ -0,0 +1,227 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def parse_printers(spec, default_port=9100):
+    """
+    Parse a PRINTERS specification into a list of printer config dicts.
+
+    Entries are comma separated, each `[name@]host[:port]`, e.g.
+    "lane1@192.168.1.200:9100,lane2@192.168.1.201". A printer's name is
+    also its lane: jobs from the device with the same name go to it first.
+    """
+    printers = []
+    for i, item in enumerate(p.strip() for p in spec.split(",")):
+        if not item:
+            continue
+        name = None
+        if "@" in item:
+            name, item = item.split("@", 1)
+        host, _, port = item.partition(":")
+        printers.append({
+            "name": name or f"printer{i + 1}",
+            "type": "network",
+            "network": {"host": host, "port": int(port) if port else default_port},
+        })
+    return printers
+
+
+class PrinterEntry:
+    """One printer in the pool with its queue and metrics"""
+
+    def __init__(self, name, printer, queue_size):
+        self.name = name
+        self.printer = printer
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.down_until = 0.0
+        self.printed = 0
+        self.failures = 0
+        self.failed_over = 0
+        self.print_seconds = 0.0
+        self.last_error = None
+
+    def healthy(self, now=None):
+        if (now if now is not None else time.monotonic()) < self.down_until:
+            return False
+        # Last probed printer status (no I/O here)
+        return getattr(self.printer, "state", "connected") == "connected"
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "healthy": self.healthy(),
+            "queue_depth": self.jobs.qsize(),
+            "printed": self.printed,
+            "failures": self.failures,
+            "failed_over": self.failed_over,
+            "avg_print_seconds": round(self.print_seconds / self.printed, 3) if self.printed else None,
+            "last_error": self.last_error,
+            "connection": self.printer.connection_state()
+            if hasattr(self.printer, "connection_state") else None,
+        }
+
+
+class PrinterPool:
+    """
+    Several ticket printers, each with its own bounded queue drained by a
+    dedicated worker.
+
+    A job goes to the healthy printer of its lane (the device it came from)
+    if there is one, otherwise to the healthy printer with the shortest
+    queue. A printer whose job fails is marked down for `down_time`
+    seconds and the job fails over to another printer it has not tried
+    yet; on_done() only runs once the job printed or ran out of printers.
+    Every `probe_interval` seconds each printer's status is probed (which
+    also reconnects dropped printers); a printer reporting a problem is not
+    routed to, and one that probes fine is routed to again.
+    The last `job_history` jobs are kept by id for status lookups.
+    """
+
+    def __init__(self, printers, queue_size=50, down_time=30, job_history=1000, probe_interval=10):
+        """printers: list of (name, TicketPrinter)"""
+        self.entries = [PrinterEntry(name, printer, queue_size) for name, printer in printers]
+        self.down_time = down_time
+        self.probe_interval = probe_interval
+        self.job_history = job_history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._started = False
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for entry in self.entries:
+            threading.Thread(target=self._worker, args=(entry,), name=f"printer-{entry.name}",
+                             daemon=True).start()
+        if self.probe_interval and self.entries:
+            threading.Thread(target=self._monitor, name="printer-health", daemon=True).start()
+
+    def _monitor(self):
+        while True:
+            for entry in self.entries:
+                probe = getattr(entry.printer, "probe", None)
+                if probe is None:
+                    continue
+                try:
+                    ok = probe()
+                except Exception as e:
+                    logger.exception("Printer %s probe failed: %s", entry.name, e)
+                    ok = False
+                if ok and entry.down_until:
+                    entry.down_until = 0.0
+                    logger.info("Printer %s is ready again", entry.name)
+            time.sleep(self.probe_interval)
+
+    def _route(self, job, exclude=()):
+        candidates = [e for e in self.entries if e.name not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [e for e in candidates if e.healthy(now)]
+        for e in healthy:
+            if job.lane is not None and e.name == job.lane:
+                return e
+        # With every printer down, still try the least loaded one
+        return min(healthy or candidates, key=lambda e: e.jobs.qsize())
+
+    def _track(self, job):
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.job_history:
+                self._jobs.popitem(last=False)
+
+    def job(self, job_id):
+        """A recent PrintJob by id, or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, job, block=True):
+        """
+        Queue a job. With block=False, return False (back-pressure) instead
+        of waiting when the chosen printer's queue is full.
+        """
+        entry = self._route(job)
+        if entry is None:
+            logger.warning("Printer not available, skipping print for %s", job.student_id)
+            self._track(job)
+            self._finish(job, False)
+            return True
+        self._track(job)
+        try:
+            entry.jobs.put(job, block=block)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+                self.rejected += 1
+            return False
+        return True
+
+    def _worker(self, entry):
+        while True:
+            job = entry.jobs.get()
+            job.status = "printing"
+            job.printers.append(entry.name)
+            ok = False
+            error = None
+            started = time.monotonic()
+            try:
+                ok = job.run(entry.printer)
+            except Exception as e:
+                error = e
+                logger.exception("Print job failed on %s for %s: %s", entry.name, job.student_id, e)
+            with self._lock:
+                if ok:
+                    entry.printed += 1
+                    entry.print_seconds += time.monotonic() - started
+                else:
+                    entry.failures += 1
+                    entry.last_error = str(error) if error else "print failed"
+                    entry.down_until = time.monotonic() + self.down_time
+            failed_over = not ok and self._fail_over(job, entry)
+            entry.jobs.task_done()
+            if not failed_over:
+                self._finish(job, ok)
+
+    def _fail_over(self, job, entry):
+        target = self._route(job, exclude=job.printers)
+        if target is None or not target.healthy():
+            return False
+        job.status = "queued"
+        try:
+            target.jobs.put_nowait(job)
+        except queue.Full:
+            return False
+        with self._lock:
+            entry.failed_over += 1
+        logger.warning("Print job %s failed on %s, failing over to %s", job.job_id, entry.name, target.name)
+        return True
+
+    def _finish(self, job, ok):
+        job.status = "printed" if ok else "failed"
+        job.finished_at = time.time()
+        if job.on_done is not None:
+            try:
+                job.on_done(ok)
+            except Exception as e:
+                logger.exception("Print completion callback failed: %s", e)
+
+    def join(self):
+        for entry in self.entries:
+            entry.jobs.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "printers": [e.stats() for e in self.entries],
+                "rejected": self.rejected,
+            }
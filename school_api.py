@@ -0,0 +1,373 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling window of request latencies (seconds)"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The deadline passed before any request could be sent"""
+
+
+class RetryBudget:
+    """
+    Global budget for extra attempts (retries and hedges).
+
+    Every first attempt deposits `ratio` tokens (capped at `max_tokens`);
+    every extra attempt spends one. Extra load on the school API therefore
+    stays around `ratio` of normal traffic, even when it is struggling.
+    """
+
+    def __init__(self, ratio=0.1, max_tokens=10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(max_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+
+class SchoolApiClient:
+    """
+    Client for the school management system API.
+
+    One requests.Session is shared by every thread, so connections to the
+    school API are kept alive and reused from a bounded pool instead of
+    paying a TCP/TLS handshake per scan. Responses are requested gzip /
+    deflate compressed.
+
+    Fee lookups honour an end-to-end `deadline` (time.monotonic() value):
+    if the first request has not answered after the `hedge_percentile`
+    latency of recent requests, a hedged second request is sent and the
+    first good answer wins; failed attempts are retried while the deadline
+    allows. Hedges and retries both draw on a shared RetryBudget. Without a
+    deadline a lookup gets `timeout` seconds in total. A deadline that
+    passed before any request was sent gives a "deadline_exceeded" result,
+    which says nothing about the school API's health; requests that were
+    sent but not answered in time give "timeout", which does.
+
+    Cached fee records can be revalidated with conditional GETs
+    (If-None-Match / If-Modified-Since), so an unchanged record costs a
+    bodiless 304 instead of a full download.
+    """
+
+    def __init__(self, base_url, api_key, pool_size=10, timeout=6, verify=True,
+                 batch_size=100, hedge_percentile=95, hedge_min_delay=0.05,
+                 hedge_default_delay=0.5, retry_budget_ratio=0.1):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.verify = verify
+        self.batch_size = batch_size
+        self.session = requests.Session()
+        # Block instead of opening throwaway connections when the pool is busy
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.latency = LatencyTracker()
+        self.retry_budget = RetryBudget(ratio=retry_budget_ratio)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="school-api")
+        self.hedges = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+        self.timeouts = 0
+        self.not_modified = 0
+
+    def _url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        with self._lock:
+            self.requests += 1
+        return self.session.get(self._url(path), **kwargs)
+
+    def post(self, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        with self._lock:
+            self.requests += 1
+        return self.session.post(self._url(path), **kwargs)
+
+    def _remaining(self, deadline):
+        if deadline is None:
+            return self.timeout
+        return deadline - time.monotonic()
+
+    def _timed_get(self, path, timeout, headers=None):
+        started = time.monotonic()
+        r = self.get(path, timeout=timeout, headers=headers)
+        if r.status_code < 500:
+            self.latency.record(time.monotonic() - started)
+        return r
+
+    def hedge_delay(self):
+        """Delay before sending a hedged request: recent latency percentile."""
+        if len(self.latency) < 20:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, self.latency.percentile(self.hedge_percentile))
+
+    def get_hedged(self, path, deadline=None, headers=None):
+        """
+        GET with deadline, hedging and budgeted retries (see class docstring).
+        Returns the first non-5xx response, else the last 5xx response.
+        Raises DeadlineExceeded if the deadline had passed before a request
+        was sent, TimeoutError if the requests sent did not answer in time.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.timeout
+        self.retry_budget.deposit()
+        last_response = None
+        last_error = None
+        attempts = 0
+        while True:
+            remaining = self._remaining(deadline)
+            if remaining <= 0:
+                break
+            attempts += 1
+            futures = {self._executor.submit(self._timed_get, path, min(self.timeout, remaining), headers)}
+            done, _ = wait(futures, timeout=min(self.hedge_delay(), remaining))
+            if not done and self._remaining(deadline) > 0 and self.retry_budget.try_spend():
+                with self._lock:
+                    self.hedges += 1
+                futures.add(self._executor.submit(self._timed_get, path,
+                                                  min(self.timeout, self._remaining(deadline)), headers))
+            pending = futures
+            while pending:
+                remaining = self._remaining(deadline)
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for f in done:
+                    try:
+                        r = f.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if r.status_code < 500:
+                        return r
+                    last_response = r
+            if self._remaining(deadline) <= 0 or not self.retry_budget.try_spend():
+                break
+            with self._lock:
+                self.retries += 1
+        if last_response is not None:
+            return last_response
+        if last_error is not None and self._remaining(deadline) > 0:
+            raise last_error
+        if not attempts:
+            with self._lock:
+                self.deadline_exceeded += 1
+            raise DeadlineExceeded(f"school API deadline exceeded for {path}")
+        with self._lock:
+            self.timeouts += 1
+        raise TimeoutError(f"school API did not answer {path} before the deadline")
+
+    def get_fees(self, student_id, deadline=None):
+        """
+        Query the school system to check paid status.
+        Expecting endpoint: GET /api/students/{id}/fees
+        returns JSON { "paid": true, "details": "..." }
+        `deadline` is a time.monotonic() value the answer is needed by.
+        """
+        result, _ = self.get_fees_conditional(student_id, deadline=deadline)
+        return result
+
+    def get_fees_conditional(self, student_id, validators=None, deadline=None):
+        """
+        Like get_fees(), revalidating a cached record: `validators` is the
+        {"etag", "last_modified"} dict returned with it. Returns
+        (result, validators); result is None when the record is unchanged
+        (304 Not Modified).
+        """
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        try:
+            r = self.get_hedged(f"students/{student_id}/fees", deadline=deadline,
+                                headers=headers or None)
+            if r.status_code == 304 and headers:
+                with self._lock:
+                    self.not_modified += 1
+                return None, validators
+            if r.status_code == 200:
+                return r.json(), self._validators(r)
+            elif r.status_code == 404:
+                logger.info("School API has no record of %s", student_id)
+                return {"paid": False, "error": "not_found", "details": "Student not found"}, None
+            else:
+                logger.warning("School API returned %s for %s", r.status_code, student_id)
+                return {"paid": False, "error": "api_error", "status": r.status_code}, None
+        except DeadlineExceeded as e:
+            logger.warning("%s", e)
+            return {"paid": False, "error": "deadline_exceeded"}, None
+        except TimeoutError as e:
+            logger.warning("%s", e)
+            return {"paid": False, "error": "timeout"}, None
+        except Exception as e:
+            logger.exception("School API call failed: %s", e)
+            return {"paid": False, "error": "exception"}, None
+
+    @staticmethod
+    def _validators(response):
+        validators = {}
+        if response.headers.get("ETag"):
+            validators["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["last_modified"] = response.headers["Last-Modified"]
+        return validators or None
+
+    def get_fees_batch(self, student_ids, deadline=None):
+        """
+        Payment status for several students with one
+        POST /api/students/fees:batch per `batch_size` ids.
+        Returns {student_id: result}, results shaped like get_fees().
+        """
+        results = {}
+        ids = [str(sid) for sid in dict.fromkeys(student_ids)]
+        for i in range(0, len(ids), self.batch_size):
+            chunk = ids[i:i + self.batch_size]
+            try:
+                remaining = self._remaining(deadline)
+                if remaining <= 0:
+                    with self._lock:
+                        self.deadline_exceeded += 1
+                    raise DeadlineExceeded("school API deadline exceeded for batch lookup")
+                r = self.post("students/fees:batch", json={"student_ids": chunk},
+                              timeout=min(self.timeout, remaining))
+                if r.status_code == 200:
+                    body = r.json()
+                    results.update(body.get("results", {}))
+                    for sid in body.get("not_found", []):
+                        results[str(sid)] = {"paid": False, "error": "not_found",
+                                             "details": "Student not found"}
+                else:
+                    logger.warning("School API batch lookup returned %s", r.status_code)
+                    for sid in chunk:
+                        results[sid] = {"paid": False, "error": "api_error", "status": r.status_code}
+            except DeadlineExceeded as e:
+                logger.warning("%s", e)
+                for sid in chunk:
+                    results[sid] = {"paid": False, "error": "deadline_exceeded"}
+            except Exception as e:
+                logger.exception("School API batch call failed: %s", e)
+                for sid in chunk:
+                    results[sid] = {"paid": False, "error": "exception"}
+        return results
+
+    @staticmethod
+    def is_upstream_failure(result):
+        """
+        True if a get_fees() result means the school API is unhealthy.
+        "deadline_exceeded" does not: no request was sent.
+        """
+        error = result.get("error")
+        if error in ("exception", "timeout"):
+            return True
+        return error == "api_error" and result.get("status", 500) >= 500
+
+    def health(self, path="health"):
+        """True if the school API answers at all (any non-5xx response)."""
+        try:
+            return self.get(path, timeout=min(self.timeout, 3)).status_code < 500
+        except Exception:
+            return False
+
+    def iter_all_fees(self, per_page=500, updated_since=None, on_total=None):
+        """
+        Yield the fee record of every student from the paginated bulk
+        endpoint GET /api/students/fees?page=N&per_page=M. With
+        `updated_since`, only records changed on or after it are returned.
+        `on_total(total)` is called with the record count the endpoint
+        reports on its first page, if it does.
+        """
+        page = 1
+        while page:
+            params = {"page": page, "per_page": per_page}
+            if updated_since:
+                params["updated_since"] = updated_since
+            r = self.get("students/fees", params=params)
+            r.raise_for_status()
+            body = r.json()
+            if page == 1 and on_total is not None and body.get("total") is not None:
+                on_total(int(body["total"]))
+            for student in body.get("students", []):
+                yield student
+            page = body.get("next_page")
+
+    def stats(self):
+        with self._lock:
+            p50 = self.latency.percentile(50)
+            p99 = self.latency.percentile(99)
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "retries": self.retries,
+                "deadline_exceeded": self.deadline_exceeded,
+                "timeouts": self.timeouts,
+                "not_modified": self.not_modified,
+                "retry_budget_tokens": round(self.retry_budget.tokens, 2),
+                "hedge_delay": round(self.hedge_delay(), 3),
+                "latency_p50": round(p50, 3) if p50 is not None else None,
+                "latency_p99": round(p99, 3) if p99 is not None else None,
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
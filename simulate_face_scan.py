@@ -77,8 +77,8 @@ def simulate_face_scan(student_id):
                 headers={"Content-Type": "application/json"},
                 json=ticket_data
             )
-            if response.status_code == 200:
-                print("   ✓ Meal ticket printed successfully")
+            if response.status_code == 202:
+                print(f"   ✓ Meal ticket queued (job {response.json()['job_id']})")
             else:
                 print(f"   ✗ Failed to print ticket: {response.json()}")
         except Exception as e:
@@ -100,8 +100,8 @@ def simulate_face_scan(student_id):
                 headers={"Content-Type": "application/json"},
                 json=error_data
             )
-            if response.status_code == 200:
-                print("   ✓ Error ticket printed")
+            if response.status_code == 202:
+                print(f"   ✓ Error ticket queued (job {response.json()['job_id']})")
             else:
                 print(f"   ✗ Failed to print error ticket: {response.json()}")
         except Exception as e:
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-device attendance checkpoint
+"""
+
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime
+
+from checkpoint import AttendanceCheckpoint, is_after
+
+Attendance = namedtuple("Attendance", "user_id timestamp status punch")
+
+
+def scan(user_id, minute, second=0):
+    return Attendance(user_id, datetime(2026, 10, 18, 12, minute, second), 1, 0)
+
+
+def test_advance_moves_to_newest_record():
+    """The checkpoint ends at the newest record, whatever the input order"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cp = AttendanceCheckpoint(os.path.join(tmp, "cp.json"))
+        cp.advance("dev", [scan("2", 31), scan("1", 30)], record_count=2)
+        entry = cp.get("dev")
+        assert entry["timestamp"] == datetime(2026, 10, 18, 12, 31).isoformat()
+        assert entry["user_ids"] == ["2"]
+        assert entry["records"] == 2
+        assert not is_after(entry, scan("1", 30))
+        assert not is_after(entry, scan("2", 31))
+        assert is_after(entry, scan("3", 32))
+
+
+def test_same_second_scans_are_not_skipped():
+    """Another face scanned in the checkpoint's second is still new"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cp = AttendanceCheckpoint(os.path.join(tmp, "cp.json"))
+        cp.advance("dev", [scan("1", 30)])
+        assert is_after(cp.get("dev"), scan("2", 30))
+        cp.advance("dev", [scan("2", 30)])
+        entry = cp.get("dev")
+        assert entry["user_ids"] == ["1", "2"]
+        assert not is_after(entry, scan("2", 30))
+
+
+def test_older_records_do_not_move_checkpoint_back():
+    with tempfile.TemporaryDirectory() as tmp:
+        cp = AttendanceCheckpoint(os.path.join(tmp, "cp.json"))
+        cp.advance("dev", [scan("1", 40)])
+        cp.advance("dev", [scan("2", 10)])
+        assert cp.get("dev")["timestamp"] == datetime(2026, 10, 18, 12, 40).isoformat()
+
+
+def test_no_checkpoint_accepts_everything():
+    assert is_after(None, scan("1", 0))
+    assert is_after({}, ("1", datetime(2020, 1, 1)))
+
+
+def test_checkpoint_survives_restart():
+    """State is persisted per device and read back by a new instance"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state", "cp.json")
+        AttendanceCheckpoint(path).advance("a", [scan("1", 30)], record_count=5)
+        reloaded = AttendanceCheckpoint(path)
+        assert reloaded.get("a")["records"] == 5
+        assert reloaded.get("b") is None
+        assert not reloaded.is_new("a", scan("1", 30))
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the school API circuit breaker
+"""
+
+import time
+
+from circuit_breaker import CircuitBreaker
+
+
+def _wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("api", probe=lambda: False, failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.stats()["times_opened"] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("api", probe=lambda: False, failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_successful_probe_closes_the_circuit():
+    probes = []
+
+    def probe():
+        probes.append(1)
+        # Upstream comes back on the second probe
+        return len(probes) >= 2
+
+    breaker = CircuitBreaker("api", probe=probe, failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert _wait_for(lambda: breaker.state == "closed")
+    assert len(probes) == 2
+    assert breaker.allow()
+    assert breaker.failures == 0
+
+
+def test_probe_exception_keeps_the_circuit_open():
+    def probe():
+        raise ConnectionError("still down")
+
+    breaker = CircuitBreaker("api", probe=probe, failure_threshold=1, reset_timeout=0.02)
+    breaker.record_failure()
+    time.sleep(0.1)
+    assert breaker.state == "open"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
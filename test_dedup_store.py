@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded, SQLite-backed dedup store
+"""
+
+import os
+import tempfile
+
+from dedup_store import DedupStore
+
+
+def test_add_if_new_rejects_duplicates():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DedupStore(os.path.join(tmp, "dedup.sqlite3"))
+        assert store.add_if_new("dev:1")
+        assert not store.add_if_new("dev:1")
+        assert "dev:1" in store
+        assert "dev:2" not in store
+
+
+def test_memory_tier_is_bounded_and_falls_back_to_disk():
+    """Ids pushed out of memory are still found on disk"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DedupStore(os.path.join(tmp, "dedup.sqlite3"), max_entries=3)
+        for i in range(10):
+            store.add(f"dev:{i}")
+        assert len(store) == 3
+        assert store.contains("dev:0")
+        assert not store.add_if_new("dev:0")
+
+
+def test_memory_window_expires_by_age():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DedupStore(os.path.join(tmp, "dedup.sqlite3"), window_seconds=-1)
+        store.add("dev:1")
+        assert len(store) == 0
+        assert "dev:1" in store
+
+
+def test_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state", "dedup.sqlite3")
+        DedupStore(path).add("dev:42")
+        reopened = DedupStore(path)
+        assert not reopened.add_if_new("dev:42")
+        assert reopened.add_if_new("dev:43")
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the scan event write-ahead journal
+"""
+
+import os
+import tempfile
+
+import event_journal
+from event_journal import EventJournal, JournalError
+
+
+def test_replay_returns_unfinished_events():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.log")
+        journal = EventJournal(path)
+        journal.append_many([
+            ("1", "received", {"student_id": "100"}),
+            ("2", "received", {"student_id": "200"}),
+        ])
+        journal.append("1", "decided", {"allowed": True})
+        journal.append("2", "printed")
+        journal.close()
+
+        reopened = EventJournal(path)
+        pending = reopened.pending()
+        reopened.close()
+        assert pending == [{"id": "1", "state": "decided",
+                            "data": {"student_id": "100", "allowed": True}}]
+
+
+def test_torn_last_line_is_ignored():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.log")
+        journal = EventJournal(path)
+        journal.append("1", "received")
+        journal.close()
+        with open(path, "a") as f:
+            f.write('{"id": "2", "sta')
+        reopened = EventJournal(path)
+        assert [e["id"] for e in reopened.pending()] == ["1"]
+        reopened.close()
+
+
+def test_compaction_keeps_only_open_events():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.log")
+        journal = EventJournal(path, compact_bytes=1024)
+        for i in range(50):
+            journal.append_many([(i, "received", {"student_id": str(i)}), (i, "printed", None)])
+        journal.append("open", "received", {"student_id": "7"})
+        journal.append("filler", "skipped", {"pad": "x" * 1024})
+        journal.close()
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert len(lines) < 10
+        reopened = EventJournal(path)
+        assert [e["id"] for e in reopened.pending()] == ["open"]
+        reopened.close()
+
+
+def test_failed_fsync_raises_to_waiters():
+    """A record that was not made durable must not look durable"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.log")
+        journal = EventJournal(path)
+        real_fsync = event_journal.os.fsync
+
+        def failing_fsync(fd):
+            raise OSError("disk full")
+
+        event_journal.os.fsync = failing_fsync
+        try:
+            try:
+                journal.append("1", "received")
+            except JournalError:
+                pass
+            else:
+                raise AssertionError("append returned after a failed fsync")
+        finally:
+            event_journal.os.fsync = real_fsync
+        assert journal.stats()["write_errors"] == 1
+        # The journal keeps working once the disk recovers
+        journal.append("2", "received")
+        journal.close()
+        reopened = EventJournal(path)
+        assert "2" in [e["id"] for e in reopened.pending()]
+        reopened.close()
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the local fee ledger replica
+"""
+
+import os
+import tempfile
+import time
+
+from fee_ledger import MAX_BIT_INDEX, Bitset, FeeLedger
+
+
+class FakeClient:
+    """Bulk fees endpoint returning `records`, or only `changes` for delta syncs"""
+
+    def __init__(self, records, changes=()):
+        self.records = records
+        self.changes = list(changes)
+
+    def iter_all_fees(self, per_page=500, updated_since=None):
+        return iter(self.changes if updated_since else self.records)
+
+
+def test_bitset_set_get_and_clear():
+    bits = Bitset()
+    assert not bits.get(0)
+    assert not bits.get(1000)
+    bits.set(3)
+    bits.set(17)
+    assert bits.get(3) and bits.get(17)
+    assert not bits.get(4)
+    assert len(bits) == 3
+    bits.set(17, False)
+    assert not bits.get(17)
+    assert bits.count() == 1
+    # Clearing past the end does not grow the bitset
+    bits.set(10000, False)
+    assert len(bits) == 3
+    assert Bitset(bits.to_bytes()).get(3)
+
+
+def test_large_ids_use_the_dict_not_the_bitset():
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = FeeLedger(os.path.join(tmp, "ledger.json"))
+        ledger.apply([
+            {"student_id": "2024000123", "paid": True},
+            {"student_id": str(MAX_BIT_INDEX - 1), "paid": False},
+            {"student_id": "ADM-7", "paid": True},
+        ])
+        assert ledger.lookup("2024000123") is True
+        assert ledger.lookup(str(MAX_BIT_INDEX - 1)) is False
+        assert ledger.lookup("ADM-7") is True
+        assert ledger.lookup("5") is None
+        stats = ledger.stats()
+        assert stats["students"] == 3
+        assert stats["index_bytes"] <= 2 * MAX_BIT_INDEX // 8
+
+
+def test_paid_answers_need_a_recent_full_sync():
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = FeeLedger(os.path.join(tmp, "ledger.json"), full_sync_interval=3600, max_lag=300)
+        records = [
+            {"student_id": "1", "paid": True, "last_payment_date": "2026-10-01"},
+            {"student_id": "2", "paid": False},
+        ]
+        ledger.sync(FakeClient(records))
+        assert ledger.fresh_result("1")["paid"] is True
+        assert ledger.fresh_result("2")["paid"] is False
+
+        # Only delta syncs since the last full reload: paid -> unpaid
+        # changes may have been missed, unpaid answers are still good
+        ledger.full_synced_at = time.time() - 3600 - 301
+        ledger.synced_at = time.time()
+        assert ledger.fresh_result("1") is None
+        assert ledger.fresh_result("2")["paid"] is False
+
+        ledger.synced_at = time.time() - 301
+        assert ledger.fresh_result("2") is None
+
+
+def test_full_sync_drops_students_that_stopped_paying():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger.json")
+        ledger = FeeLedger(path, full_sync_interval=3600)
+        ledger.sync(FakeClient([{"student_id": "1", "paid": True, "last_payment_date": "2026-10-01"}]))
+        ledger.sync(FakeClient([{"student_id": "1", "paid": False}]), full=True)
+        assert ledger.lookup("1") is False
+
+        reloaded = FeeLedger(path)
+        assert reloaded.lookup("1") is False
+        assert reloaded.full_synced_at == ledger.full_synced_at
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
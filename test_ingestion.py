@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Tests for device ingestion in live mode, against a fake pyzk connection
+"""
+
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from checkpoint import AttendanceCheckpoint
+from ingestion import DeviceIngestor
+from user_directory import UserDirectory
+from zk_device import ZKDevice
+
+Attendance = namedtuple("Attendance", "user_id timestamp status punch")
+DROP = object()
+
+
+def scan(user_id, second):
+    return Attendance(str(user_id), datetime(2026, 10, 19, 12, 30, second), 1, 0)
+
+
+class FakeConnection:
+    """pyzk connection: a stored attendance log plus a live event stream"""
+
+    def __init__(self, records=()):
+        self.log = list(records)
+        self.events = queue.Queue()
+        self.transfers = 0
+        self.streams = 0
+        self.end_live_capture = False
+
+    def get_time(self):
+        return datetime.now()
+
+    def read_sizes(self):
+        self.records = len(self.log)
+        self.users = 10
+
+    def get_attendance(self):
+        self.transfers += 1
+        return list(self.log)
+
+    def live_capture(self, timeout):
+        self.streams += 1
+        self.end_live_capture = False
+        while not self.end_live_capture:
+            try:
+                event = self.events.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+                continue
+            if event is DROP:
+                raise ConnectionError("stream dropped")
+            self.log.append(event)
+            yield event
+
+
+def _device(conn):
+    device = ZKDevice("10.0.0.9", keepalive_interval=3600)
+    device.conn = conn
+    device._connected = True
+    device.state = "connected"
+    device._touch()
+    return device
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _start(device, tmp):
+    handled = []
+    checkpoints = AttendanceCheckpoint(os.path.join(tmp, "cp.json"))
+    ingestor = DeviceIngestor(device, checkpoints, handled.extend, key="dev", mode="live",
+                              poll_interval=0.05, retry_delay=0.05)
+    threading.Thread(target=ingestor.run, daemon=True).start()
+    return ingestor, handled
+
+
+def test_catches_up_after_a_dropped_stream():
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = FakeConnection([scan(1, 0), scan(2, 1)])
+        device = _device(conn)
+        ingestor, handled = _start(device, tmp)
+        try:
+            _wait_for(lambda: device.streaming)
+            assert [l.user_id for l in handled] == ["1", "2"]
+            conn.events.put(scan(3, 2))
+            _wait_for(lambda: len(handled) == 3)
+            # Recorded while the stream is down
+            conn.log.append(scan(4, 3))
+            conn.events.put(DROP)
+            _wait_for(lambda: len(handled) == 4 and device.streaming)
+        finally:
+            ingestor.stop()
+        assert [l.user_id for l in handled] == ["1", "2", "3", "4"]
+        assert conn.transfers == 2
+
+
+def test_stream_pauses_for_other_threads_without_a_log_download():
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = FakeConnection([scan(1, 0)])
+        device = _device(conn)
+        ingestor, handled = _start(device, tmp)
+        try:
+            _wait_for(lambda: device.streaming)
+            conn.events.put(scan(2, 1))
+            _wait_for(lambda: len(handled) == 2)
+            # Another thread needs the device: the stream pauses for it
+            assert device.get_user_count() == 10
+            _wait_for(lambda: conn.streams == 2 and device.streaming)
+            # Messages never interrupt a stream
+            assert device.send_display_message("hello") is False
+            conn.events.put(scan(3, 2))
+            _wait_for(lambda: len(handled) == 3)
+        finally:
+            ingestor.stop()
+        assert [l.user_id for l in handled] == ["1", "2", "3"]
+        # Only the first catch-up downloaded the log: the streamed events
+        # kept the checkpoint's record count in step with the device
+        assert conn.transfers == 1
+
+
+def test_fast_polls_space_out_log_downloads():
+    """Between downloads a poll only reads the record count"""
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = FakeConnection([scan(1, 0)])
+        device = _device(conn)
+        device.transfer_spacing = 1000
+        handled = []
+        ingestor = DeviceIngestor(device, AttendanceCheckpoint(os.path.join(tmp, "cp.json")),
+                                  handled.extend, key="dev")
+        ingestor.poll_once()
+        device.last_transfer_seconds = 0.01
+        conn.log.append(scan(2, 1))
+        assert ingestor.poll_once() == 0
+        assert conn.transfers == 1
+        assert device.deferred_transfers == 1
+        # Once the slot comes round the new record is picked up
+        device.last_transfer_at -= 10
+        assert ingestor.poll_once() == 1
+        assert [l.user_id for l in handled] == ["1", "2"]
+        assert conn.transfers == 2
+
+
+def test_user_directory_leaves_streaming_devices_alone():
+    class StreamingDevice:
+        streaming = True
+
+        def get_user_count(self):
+            raise AssertionError("would pause the stream")
+
+    directory = UserDirectory(full_refresh_interval=3600)
+    directory._device_state["dev"] = {"count": 10, "loaded_at": time.monotonic()}
+    assert directory.refresh("dev", StreamingDevice()) is False
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the meal eligibility rules
+"""
+
+import os
+import tempfile
+from datetime import datetime
+
+from meal_rules import MealRules, RuleSet
+from meal_windows import parse_meal_windows
+
+WINDOWS = parse_meal_windows("breakfast=07:00-08:30,lunch=12:30-14:00")
+LUNCH = datetime(2026, 10, 19, 13, 0)
+BREAKFAST = datetime(2026, 10, 19, 7, 30)
+PAID = {"paid": True}
+UNPAID = {"paid": False}
+
+
+def _rules(config):
+    rules = MealRules(WINDOWS)
+    rules.rules = RuleSet(config, WINDOWS)
+    return rules
+
+
+def test_unpaid_and_unknown_students_are_denied():
+    rules = _rules({})
+    assert rules.decide("1", PAID, LUNCH).allowed
+    assert rules.decide("2", UNPAID, LUNCH).reason == "unpaid"
+    assert rules.decide("3", {"paid": False, "error": "not_found"}, LUNCH).reason == "not_found"
+
+
+def test_meal_window_is_required_when_configured():
+    rules = _rules({"require_meal_window": True})
+    decision = rules.decide("1", PAID, datetime(2026, 10, 19, 10, 0))
+    assert decision.reason == "outside_meal_window"
+    assert rules.decide("1", PAID, LUNCH).window.name == "lunch"
+
+
+def test_quota_per_window_and_per_day():
+    rules = _rules({"meals_per_day": 2, "meals_per_window": 1})
+    assert rules.decide("1", PAID, BREAKFAST).allowed
+    assert rules.decide("1", PAID, BREAKFAST).reason == "window_limit"
+    assert rules.decide("1", PAID, LUNCH).allowed
+    assert rules.decide("1", PAID, datetime(2026, 10, 19, 18, 0)).reason == "daily_limit"
+    # Counts start over the next day
+    assert rules.decide("1", PAID, datetime(2026, 10, 20, 7, 30)).allowed
+
+
+def test_grace_serves_unpaid_students_until_it_ends():
+    rules = _rules({"grace": {"1002": "2026-10-19", "1003": None}})
+    decision = rules.decide("1002", UNPAID, LUNCH)
+    assert decision.allowed and decision.grace
+    assert rules.decide("1002", UNPAID, datetime(2026, 10, 20, 13, 0)).reason == "unpaid"
+    assert rules.decide("1003", UNPAID, datetime(2030, 1, 1, 13, 0)).allowed
+    # A paid student is not flagged as served under grace
+    assert not rules.decide("1002", PAID, LUNCH).grace
+
+
+def test_balance_due_threshold():
+    rules = _rules({"max_balance_due": 500})
+    assert rules.decide("1", {"paid": False, "balance": 200}, LUNCH).allowed
+    assert rules.decide("2", {"paid": False, "balance": 500}, LUNCH).allowed
+    assert rules.decide("3", {"paid": False, "balance": 501}, LUNCH).reason == "balance_due"
+    # Without a balance the student is just unpaid
+    assert rules.decide("4", UNPAID, LUNCH).reason == "unpaid"
+
+
+def test_released_meal_can_be_taken_again():
+    """A ticket that failed to print must not use up the meal"""
+    rules = _rules({"meals_per_window": 1})
+    decision = rules.decide("1", PAID, LUNCH)
+    assert decision.allowed
+    assert rules.decide("1", PAID, LUNCH).reason == "window_limit"
+    assert rules.release("1", decision)
+    assert not rules.release("1", decision)
+    assert rules.stats()["meals_served_today"] == 0
+    assert rules.decide("1", PAID, LUNCH).allowed
+
+
+def test_meal_counts_survive_a_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        state_path = os.path.join(tmp, "state", "meals.jsonl")
+        config = {"meals_per_day": 2, "meals_per_window": 1}
+        rules = MealRules(WINDOWS, state_path=state_path)
+        rules.rules = RuleSet(config, WINDOWS)
+        assert rules.decide("1", PAID, BREAKFAST).allowed
+        released = rules.decide("2", PAID, BREAKFAST)
+        rules.release("2", released)
+
+        restarted = MealRules(WINDOWS, state_path=state_path)
+        restarted.rules = RuleSet(config, WINDOWS)
+        assert restarted.decide("1", PAID, BREAKFAST).reason == "window_limit"
+        assert restarted.decide("2", PAID, BREAKFAST).allowed
+        assert restarted.decide("1", PAID, LUNCH).allowed
+        assert restarted.decide("1", PAID, datetime(2026, 10, 19, 18, 0)).reason == "daily_limit"
+
+        # The next day starts from zero and drops the old counts from disk
+        assert restarted.decide("1", PAID, datetime(2026, 10, 20, 7, 30)).allowed
+        again = MealRules(WINDOWS, state_path=state_path)
+        assert again.stats()["meals_served_today"] == 1
+
+
+def test_rules_file_is_reloaded():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rules.yml")
+        with open(path, "w") as f:
+            f.write("meals_per_day: 1\n")
+        rules = MealRules(WINDOWS, path=path)
+        assert rules.rules.meals_per_day == 1
+        with open(path, "w") as f:
+            f.write("meals_per_day: [not, a, number\n")
+        assert not rules.reload(force=True)
+        assert rules.last_error
+        assert rules.rules.meals_per_day == 1
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
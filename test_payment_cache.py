@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the payment status cache
+"""
+
+import time
+
+from payment_cache import PaymentCache
+
+ETAG = {"etag": '"v1"', "last_modified": "Mon, 19 Oct 2026 07:00:00 GMT"}
+
+
+def test_errors_are_not_cached():
+    cache = PaymentCache()
+    assert not cache.put("1", {"paid": False, "error": "exception"})
+    assert cache.get("1") is None
+    assert cache.put("2", {"paid": False, "error": "not_found"})
+    assert cache.get("2")["error"] == "not_found"
+
+
+def test_put_without_validators_keeps_them_for_the_same_record():
+    """A bulk or batch refresh must not wipe the ETag of an unchanged record"""
+    cache = PaymentCache()
+    cache.put("1", {"paid": True}, validators=ETAG)
+    cache.put("1", {"paid": True}, ttl=60)
+    assert cache.validators("1") == ETAG
+    # A changed record no longer matches the validators it came with
+    cache.put("1", {"paid": False})
+    assert cache.validators("1") is None
+
+
+def test_refresh_rearms_an_expired_entry():
+    cache = PaymentCache()
+    cache.put("1", {"paid": True}, ttl=0.01, validators=ETAG)
+    time.sleep(0.02)
+    assert cache.get("1") is None
+    assert cache.get_stale("1", max_age=60)[0] == {"paid": True}
+    assert cache.refresh("1") == {"paid": True}
+    assert cache.get("1") == {"paid": True}
+    assert cache.validators("1") == ETAG
+
+
+def test_lru_eviction():
+    cache = PaymentCache(max_entries=2)
+    cache.put("1", {"paid": True})
+    cache.put("2", {"paid": True})
+    cache.get("1")
+    cache.put("3", {"paid": True})
+    assert cache.get("2") is None
+    assert cache.get("1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the ready-to-print student photo cache
+"""
+
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from photo_cache import PhotoCache, raster_command
+
+
+def test_raster_command_header_and_bits():
+    # 10x2: first row black on the left 3 dots, second row all white
+    image = Image.new("L", (10, 2), 255)
+    for x in range(3):
+        image.putpixel((x, 0), 0)
+    data = raster_command(image)
+    # GS v 0, mode 0, 2 bytes per row, 2 rows
+    assert data[:8] == b"\x1dv0\x00\x02\x00\x02\x00"
+    assert data[8:] == bytes([0b11100000, 0, 0, 0])
+
+
+def test_raster_command_clears_row_padding():
+    """Bits past the image width must not print as black dots"""
+    image = Image.new("L", (10, 1), 0)
+    data = raster_command(image)
+    assert data[8:] == bytes([0xFF, 0b11000000])
+
+
+def test_raster_command_large_image_header():
+    image = Image.new("1", (400, 300), 1)
+    data = raster_command(image)
+    assert data[4:8] == bytes([50, 0, 300 & 0xFF, 300 >> 8])
+    assert len(data) == 8 + 50 * 300
+
+
+def test_identical_photos_share_a_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PhotoCache(tmp)
+        cache._store("http://school/a.jpg", b"raster", {"etag": '"a"'})
+        cache._store("http://school/b.jpg", b"raster", {})
+        assert cache.get("http://school/a.jpg") == b"raster"
+        assert len([f for f in os.listdir(tmp) if f.endswith(".raster")]) == 1
+        cache.flush()
+        reloaded = PhotoCache(tmp)
+        assert reloaded.get("http://school/b.jpg") == b"raster"
+
+
+def test_least_recently_used_photos_are_evicted():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PhotoCache(tmp, max_bytes=20)
+        cache._store("a", b"a" * 8, {})
+        cache._store("b", b"b" * 8, {})
+        cache.get("a")
+        cache._store("c", b"c" * 8, {})
+        assert cache.get("b") is None
+        assert cache.get("a") == b"a" * 8
+        assert cache.stats()["evictions"] == 1
+        assert len([f for f in os.listdir(tmp) if f.endswith(".raster")]) == 2
+
+
+def test_many_stores_keep_byte_total_and_file_counts():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PhotoCache(tmp, max_bytes=100 * 64)
+        started = time.monotonic()
+        for i in range(5000):
+            # Every other URL shares its photo with the one before it
+            cache._store(f"http://school/{i}.jpg", bytes([i // 2 % 256]) * 64 + str(i // 2).encode(), {})
+        assert time.monotonic() - started < 5
+        stats = cache.stats()
+        files = [f for f in os.listdir(tmp) if f.endswith(".raster")]
+        assert stats["files"] == len(files)
+        assert stats["bytes"] == sum(os.path.getsize(os.path.join(tmp, f)) for f in files)
+        assert stats["bytes"] <= cache.max_bytes
+        assert cache.get("http://school/4999.jpg") is not None
+        assert cache.get("http://school/0.jpg") is None
+
+        cache.flush()
+        reloaded = PhotoCache(tmp, max_bytes=100 * 64)
+        assert reloaded.stats()["photos"] == stats["photos"]
+        assert reloaded.stats()["bytes"] == stats["bytes"]
+
+
+def test_unsaved_photos_are_cleaned_up_on_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PhotoCache(tmp, save_interval=3600)
+        cache._store("a", b"first", {})
+        cache._store("b", b"second", {})
+        # Only the first store wrote the index
+        reloaded = PhotoCache(tmp)
+        assert reloaded.get("a") == b"first"
+        assert reloaded.get("b") is None
+        assert len([f for f in os.listdir(tmp) if f.endswith(".raster")]) == 1
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
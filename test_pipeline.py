@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for the staged scan pipeline
+"""
+
+import threading
+import time
+
+from pipeline import PrintJob, ScanEvent, ScanPipeline
+
+
+class FakePrinter:
+    state = "connected"
+
+    def print_ticket(self, **kwargs):
+        return True
+
+
+def _events(*student_ids):
+    return [ScanEvent(sid, f"event-{sid}") for sid in student_ids]
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_full_scan_queue_blocks_the_poller():
+    pipeline = ScanPipeline(lambda event: None, [], queue_size=2, decision_workers=1)
+    assert pipeline.submit(_events("1")[0])
+    assert pipeline.submit(_events("2")[0])
+    assert not pipeline.submit(_events("3")[0], timeout=0.05)
+    assert pipeline.stats()["backpressure_waits"] == 1
+
+    submitted = threading.Event()
+    threading.Thread(target=lambda: pipeline.submit(_events("4")[0]) and submitted.set(),
+                     daemon=True).start()
+    assert not submitted.wait(0.1)
+    pipeline.start()
+    assert submitted.wait(5)
+    pipeline.join()
+    stats = pipeline.stats()
+    assert stats["backpressure_waits"] == 2
+    assert stats["backpressure_seconds"] > 0
+    assert stats["submitted"] == 3
+    assert stats["decided"] == 3
+
+
+def test_queue_depth_is_counted_in_scans():
+    pipeline = ScanPipeline(lambda event: None, [], queue_size=5)
+    assert pipeline.submit_batch(_events("1", "2", "3"))
+    stats = pipeline.stats()
+    assert stats["scan_queue_depth"] == 3
+    assert stats["scan_queue_capacity"] == 5
+    assert not pipeline.submit_batch(_events("4", "5", "6"), timeout=0.05)
+    assert pipeline.submit_batch(_events("4", "5"))
+    assert pipeline.stats()["scan_queue_depth"] == 5
+
+
+def test_oversized_batch_is_accepted_into_an_empty_queue():
+    pipeline = ScanPipeline(lambda event: None, [], queue_size=2)
+    assert pipeline.submit_batch(_events("1", "2", "3"), timeout=0.05)
+    assert pipeline.stats()["scan_queue_depth"] == 3
+
+
+def test_batch_is_prepared_once_then_decided_per_scan():
+    prepared = []
+    decided = []
+    pipeline = ScanPipeline(lambda event: decided.append(event.student_id), [],
+                            prepare=lambda events: prepared.append([e.student_id for e in events]),
+                            decision_workers=1)
+    pipeline.start()
+    pipeline.submit_batch(_events("1", "2", "3"))
+    pipeline.submit(_events("4")[0])
+    pipeline.join()
+    assert prepared == [["1", "2", "3"]]
+    assert decided == ["1", "2", "3", "4"]
+    assert pipeline.stats()["scan_queue_depth"] == 0
+
+
+def test_decision_errors_are_counted_and_do_not_stop_the_batch():
+    def decide(event):
+        if event.student_id == "2":
+            raise ValueError("bad record")
+        return None
+
+    def prepare(events):
+        raise ConnectionError("school API down")
+
+    pipeline = ScanPipeline(decide, [], prepare=prepare, decision_workers=1)
+    pipeline.start()
+    pipeline.submit_batch(_events("1", "2", "3"))
+    pipeline.join()
+    stats = pipeline.stats()
+    assert stats["decided"] == 2
+    assert stats["decision_errors"] == 1
+
+
+def test_stats_report_print_queue_depths():
+    pipeline = ScanPipeline(lambda event: None, [("gate", FakePrinter()), ("hall", FakePrinter())],
+                            print_queue_size=3, printer_probe_interval=0)
+    pipeline.submit_print(PrintJob("print_ticket", {}, student_id="1", lane="hall"))
+    stats = pipeline.stats()
+    assert stats["print_queue_depths"] == [0, 1]
+    assert stats["print_queue_capacity"] == 3
+    pipeline.start()
+    pipeline.join()
+    _wait_for(lambda: pipeline.stats()["printed"] == 1)
+    assert pipeline.stats()["print_queue_depths"] == [0, 0]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive device poll cadence
+"""
+
+from datetime import datetime
+
+from meal_windows import parse_meal_windows
+from poll_scheduler import AdaptivePollScheduler
+
+LUNCH = datetime(2026, 10, 19, 13, 0)
+AFTERNOON = datetime(2026, 10, 19, 16, 0)
+
+
+def _scheduler():
+    return AdaptivePollScheduler(parse_meal_windows("lunch=12:30-14:00"), fast_interval=0.5,
+                                 normal_interval=3, idle_interval=30, rush_threshold=5,
+                                 rush_window=60, cooldown=300)
+
+
+def test_idle_without_scans_outside_meal_windows():
+    scheduler = _scheduler()
+    assert scheduler.mode(now=1000, wall_clock=AFTERNOON) == "idle"
+    assert scheduler.next_interval(now=1000, wall_clock=AFTERNOON) == 30
+
+
+def test_meal_window_polls_fast():
+    scheduler = _scheduler()
+    assert scheduler.mode(now=1000, wall_clock=LUNCH) == "meal"
+    assert scheduler.next_interval(now=1000, wall_clock=LUNCH) == 0.5
+
+
+def test_recent_scans_keep_the_device_active_until_cooldown():
+    scheduler = _scheduler()
+    scheduler.record_scans(1, now=1000)
+    assert scheduler.mode(now=1010, wall_clock=AFTERNOON) == "active"
+    assert scheduler.next_interval(now=1010, wall_clock=AFTERNOON) == 3
+    assert scheduler.mode(now=1000 + 300, wall_clock=AFTERNOON) == "idle"
+
+
+def test_rush_is_scans_within_the_rush_window():
+    scheduler = _scheduler()
+    scheduler.record_scans(2, now=1000)
+    scheduler.record_scans(0, now=1001)
+    scheduler.record_scans(3, now=1030)
+    assert scheduler.recent_scans(now=1030) == 5
+    assert scheduler.mode(now=1030, wall_clock=AFTERNOON) == "rush"
+    assert scheduler.next_interval(now=1030, wall_clock=AFTERNOON) == 0.5
+    # The first scans age out of the window
+    assert scheduler.recent_scans(now=1061) == 3
+    assert scheduler.mode(now=1061, wall_clock=AFTERNOON) == "active"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the queued print endpoints, through the Flask test client
+"""
+
+import time
+
+from pipeline import ScanPipeline
+
+
+class FakePrinter:
+    state = "connected"
+
+    def print_ticket(self, **kwargs):
+        return True
+
+
+class _PatchedApp:
+    """Give app a pipeline with unstarted fake printers, restoring state after"""
+
+    def __init__(self, print_queue_size=2):
+        import app
+        self.app = app
+        self.pipeline = ScanPipeline(lambda event: None, [("gate", FakePrinter())],
+                                     print_queue_size=print_queue_size, printer_probe_interval=0)
+
+    def __enter__(self):
+        app = self.app
+        self.saved = (app.init_services, app.pipeline, app.printer)
+        app.init_services = lambda: None
+        app.pipeline = self.pipeline
+        app.printer = FakePrinter()
+        return app.app.test_client()
+
+    def __exit__(self, *exc):
+        app = self.app
+        app.init_services, app.pipeline, app.printer = self.saved
+
+
+def test_print_is_queued_with_a_job_id():
+    with _PatchedApp() as client:
+        response = client.post("/test-print", json={"name": "Ada", "id": "1001"})
+        assert response.status_code == 202
+        body = response.get_json()
+        assert body["job_id"]
+        assert body["status"] == "queued"
+        assert response.headers["Location"].endswith(f"/print-jobs/{body['job_id']}")
+        assert body["status_url"] == f"/print-jobs/{body['job_id']}"
+
+
+def test_full_print_queue_answers_503_with_retry_after():
+    with _PatchedApp(print_queue_size=1) as client:
+        assert client.post("/test-print", json={"id": "1"}).status_code == 202
+        response = client.post("/test-error", json={"message": "Not paid"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        body = response.get_json()
+        assert body["queue_depths"] == [1]
+        assert body["queue_capacity"] == 1
+
+
+def test_print_job_status_and_unknown_job():
+    patched = _PatchedApp()
+    with patched as client:
+        job_id = client.post("/test-print", json={"id": "1002"}).get_json()["job_id"]
+        response = client.get(f"/print-jobs/{job_id}")
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body["job_id"] == job_id
+        assert body["method"] == "print_ticket"
+        assert body["student_id"] == "1002"
+        assert body["status"] == "queued"
+        assert client.get("/print-jobs/no-such-job").status_code == 404
+
+        patched.pipeline.start()
+        deadline = time.monotonic() + 5
+        while client.get(f"/print-jobs/{job_id}").get_json()["status"] != "printed":
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.01)
+        assert client.get(f"/print-jobs/{job_id}").get_json()["printers"] == ["gate"]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
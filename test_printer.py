@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Tests for the ticket printer's DLE EOT status probe and reconnect backoff
+"""
+
+import time
+
+import printer
+from printer import STATUS_OFFLINE, STATUS_PAPER, STATUS_PRINTER, TicketPrinter
+
+CFG = {"type": "network", "network": {"host": "10.0.0.7"}}
+
+# Status replies: fixed bits 0x12 plus the condition bits
+READY = 0x12
+OFFLINE = 0x12 | 0x08
+COVER_OPEN = 0x12 | 0x04
+PAPER_STOP = 0x12 | 0x20
+NEAR_END = 0x12 | 0x0C
+PAPER_OUT = 0x12 | 0x60
+
+
+class FakeNetwork:
+    """escpos Network printer answering DLE EOT requests from `replies`"""
+
+    opened = 0
+    fail_open = False
+
+    def __init__(self, host, port=9100, timeout=5):
+        self.replies = {STATUS_PRINTER: READY, STATUS_OFFLINE: READY, STATUS_PAPER: READY}
+        self.written = []
+        self._last = None
+
+    def open(self):
+        if FakeNetwork.fail_open:
+            raise OSError("connection refused")
+        FakeNetwork.opened += 1
+
+    def close(self):
+        pass
+
+    def _raw(self, data):
+        self.written.append(data)
+        self._last = data
+
+    def _read(self):
+        reply = self.replies.get(self._last)
+        return b"" if reply is None else bytes([reply])
+
+
+class _FakePrinter:
+    """Swap escpos Network for FakeNetwork, restoring it after"""
+
+    def __enter__(self):
+        self.saved = printer.Network
+        printer.Network = FakeNetwork
+        FakeNetwork.opened = 0
+        FakeNetwork.fail_open = False
+        return TicketPrinter(dict(CFG), backoff_base=0.05, backoff_max=0.05)
+
+    def __exit__(self, *exc):
+        printer.Network = self.saved
+
+
+def test_ready_printer_stays_connected():
+    with _FakePrinter() as p:
+        assert p.probe()
+        assert p.state == "connected" and p.ready()
+        assert not p.paper_near_end
+        # An online printer is not asked why it is offline
+        assert p.printer.written == [STATUS_PRINTER, STATUS_PAPER]
+
+
+def test_cover_open_blocks_printing():
+    with _FakePrinter() as p:
+        p.printer.replies.update({STATUS_PRINTER: OFFLINE, STATUS_OFFLINE: COVER_OPEN})
+        assert not p.probe()
+        assert p.state == "cover_open" and not p.ready()
+        assert p.last_error == "cover open"
+        assert not p.print_ticket("Ada", "1001", "Lunch")
+        # Closing the cover is picked up by the next probe
+        p.printer.replies.update({STATUS_PRINTER: READY, STATUS_OFFLINE: READY})
+        assert p.probe() and p.ready()
+
+
+def test_paper_out_from_either_status_byte():
+    with _FakePrinter() as p:
+        p.printer.replies[STATUS_PAPER] = PAPER_OUT
+        assert not p.probe()
+        assert p.state == "paper_out" and not p.ready()
+    with _FakePrinter() as p:
+        p.printer.replies.update({STATUS_PRINTER: OFFLINE, STATUS_OFFLINE: PAPER_STOP})
+        assert not p.probe()
+        assert p.state == "paper_out"
+        assert p.last_error == "paper out"
+
+
+def test_paper_near_end_still_prints():
+    with _FakePrinter() as p:
+        p.printer.replies[STATUS_PAPER] = NEAR_END
+        assert p.probe()
+        assert p.paper_near_end and p.ready()
+        assert p.connection_state()["paper_near_end"]
+
+
+def test_bad_status_byte_backs_off_then_reconnects():
+    for reply in (0x00, 0x80 | READY, None):
+        with _FakePrinter() as p:
+            p.printer.replies[STATUS_PAPER] = reply
+            assert not p.probe()
+            assert p.state == "backoff" and p.printer is None
+            assert p.failures == 1
+            assert "status probe failed" in p.last_error
+            # No reconnect while backing off
+            assert not p.ready()
+            assert FakeNetwork.opened == 1
+            assert p.connection_state()["retry_in"] <= 0.05
+
+            time.sleep(0.06)
+            assert p.ready()
+            assert p.state == "connected"
+            assert FakeNetwork.opened == 2
+            assert p.failures == 0 and p.reconnects == 1
+            assert p.last_error is None
+
+
+def test_failed_reconnect_doubles_the_backoff():
+    with _FakePrinter() as p:
+        p.backoff_max = 10
+        FakeNetwork.fail_open = True
+        p._failed("dropped")
+        p.next_attempt = 0
+        assert not p.ready()
+        assert p.failures == 2 and p.state == "backoff"
+        # base * 2, with jitter between half and all of it
+        assert 0.05 <= p.next_attempt - time.monotonic() <= 0.1
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
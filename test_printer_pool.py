@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for printer pool routing and failover
+"""
+
+import threading
+
+from pipeline import PrintJob
+from printer_pool import PrinterPool, parse_printers
+
+
+class FakePrinter:
+    def __init__(self, ok=True, state="connected"):
+        self.ok = ok
+        self.state = state
+        self.printed = []
+
+    def print_ticket(self, **kwargs):
+        self.printed.append(kwargs)
+        return self.ok
+
+
+def _job(lane=None):
+    return PrintJob("print_ticket", {"student_id": "1"}, student_id="1", lane=lane)
+
+
+def test_parse_printers():
+    printers = parse_printers("lane1@10.0.0.5:9101, 10.0.0.6")
+    assert [p["name"] for p in printers] == ["lane1", "printer2"]
+    assert printers[0]["network"] == {"host": "10.0.0.5", "port": 9101}
+    assert printers[1]["network"]["port"] == 9100
+
+
+def test_jobs_go_to_their_lane_printer():
+    pool = PrinterPool([("gate", FakePrinter()), ("hall", FakePrinter())], probe_interval=0)
+    for _ in range(3):
+        assert pool.submit(_job(lane="hall"))
+    assert [e.jobs.qsize() for e in pool.entries] == [0, 3]
+
+
+def test_unhealthy_lane_falls_back_to_the_shortest_queue():
+    pool = PrinterPool([("gate", FakePrinter(state="backoff")), ("a", FakePrinter()),
+                        ("b", FakePrinter())], probe_interval=0)
+    pool.submit(_job(lane="a"))
+    pool.submit(_job(lane="gate"))
+    assert [e.jobs.qsize() for e in pool.entries] == [0, 1, 1]
+    pool.submit(_job())
+    pool.submit(_job())
+    assert sorted(e.jobs.qsize() for e in pool.entries[1:]) == [2, 2]
+
+
+def test_full_queue_is_back_pressure():
+    pool = PrinterPool([("gate", FakePrinter())], queue_size=1, probe_interval=0)
+    assert pool.submit(_job(), block=False)
+    job = _job()
+    assert not pool.submit(job, block=False)
+    assert pool.job(job.job_id) is None
+    assert pool.stats()["rejected"] == 1
+
+
+def test_failed_job_fails_over_to_another_printer():
+    broken, spare = FakePrinter(ok=False), FakePrinter()
+    pool = PrinterPool([("gate", broken), ("hall", spare)], down_time=60, probe_interval=0)
+    pool.start()
+    done = []
+    finished = threading.Event()
+    job = _job(lane="gate")
+    job.on_done = lambda ok: (done.append(ok), finished.set())
+    pool.submit(job)
+    assert finished.wait(5)
+    assert done == [True]
+    assert job.printers == ["gate", "hall"]
+    assert job.status == "printed"
+    assert len(spare.printed) == 1
+    gate = pool.stats()["printers"][0]
+    assert gate["failures"] == 1 and gate["failed_over"] == 1
+    assert not gate["healthy"]
+    # The failed printer is skipped while it is marked down
+    pool.submit(_job(lane="gate"))
+    pool.join()
+    assert len(broken.printed) == 1
+    assert len(spare.printed) == 2
+
+
+def test_job_fails_once_every_printer_has_tried_it():
+    pool = PrinterPool([("a", FakePrinter(ok=False)), ("b", FakePrinter(ok=False))],
+                       probe_interval=0)
+    pool.start()
+    done = []
+    finished = threading.Event()
+    job = _job()
+    job.on_done = lambda ok: (done.append(ok), finished.set())
+    pool.submit(job)
+    assert finished.wait(5)
+    pool.join()
+    assert done == [False]
+    assert sorted(job.printers) == ["a", "b"]
+    assert pool.job(job.job_id).status == "failed"
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
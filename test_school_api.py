@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for school API deadlines, hedging and the retry budget
+"""
+
+import threading
+import time
+
+from school_api import RetryBudget, SchoolApiClient
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.headers = {}
+
+    def json(self):
+        return self._body
+
+
+def _client(**kwargs):
+    return SchoolApiClient("http://school.invalid/api", "test-key", **kwargs)
+
+
+def test_retry_budget_caps_deposits_and_spends_whole_tokens():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    budget.deposit()
+    assert not budget.try_spend()
+    budget.deposit()
+    assert budget.try_spend()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 2
+
+
+def test_slow_request_is_hedged():
+    client = _client(hedge_default_delay=0.05)
+    calls = []
+    lock = threading.Lock()
+
+    def timed_get(path, timeout, headers=None):
+        with lock:
+            calls.append(path)
+            first = len(calls) == 1
+        if first:
+            time.sleep(0.5)
+            return FakeResponse(200, {"paid": False})
+        return FakeResponse(200, {"paid": True})
+
+    client._timed_get = timed_get
+    r = client.get_hedged("students/1/fees", deadline=time.monotonic() + 2)
+    assert r.json() == {"paid": True}
+    assert len(calls) == 2
+    assert client.stats()["hedges"] == 1
+    client.close()
+
+
+def test_hedges_stop_when_the_budget_is_spent():
+    client = _client(hedge_default_delay=0.01)
+    client.retry_budget = RetryBudget(ratio=0, max_tokens=0)
+    calls = []
+
+    def timed_get(path, timeout, headers=None):
+        calls.append(path)
+        time.sleep(0.05)
+        return FakeResponse(503)
+
+    client._timed_get = timed_get
+    r = client.get_hedged("students/1/fees", deadline=time.monotonic() + 1)
+    assert r.status_code == 503
+    assert len(calls) == 1
+    client.close()
+
+
+def test_deadline_exceeded_is_not_an_upstream_failure():
+    """A scan that waited out its deadline in the queue says nothing about the API"""
+    client = _client()
+    calls = []
+    client._timed_get = lambda path, timeout, headers=None: calls.append(path)
+    result = client.get_fees("1", deadline=time.monotonic() - 1)
+    assert result == {"paid": False, "error": "deadline_exceeded"}
+    assert not calls
+    assert not SchoolApiClient.is_upstream_failure(result)
+    batch = client.get_fees_batch(["1", "2"], deadline=time.monotonic() - 1)
+    assert all(r["error"] == "deadline_exceeded" for r in batch.values())
+    assert client.stats()["deadline_exceeded"] == 2
+    client.close()
+
+
+def test_unanswered_request_is_an_upstream_timeout():
+    client = _client(timeout=0.2, hedge_default_delay=0.05)
+    calls = []
+
+    def hang(path, timeout, headers=None):
+        calls.append(path)
+        time.sleep(0.5)
+        return FakeResponse(200)
+
+    client._timed_get = hang
+    started = time.monotonic()
+    result = client.get_fees("1", deadline=time.monotonic() + 0.1)
+    assert result == {"paid": False, "error": "timeout"}
+    assert SchoolApiClient.is_upstream_failure(result)
+    # Without a deadline a lookup still gets one timeout in total
+    assert client.get_fees("1")["error"] == "timeout"
+    assert time.monotonic() - started < 0.6
+    assert len(calls) <= 4
+    assert client.stats()["timeouts"] == 2
+    client.close()
+
+
+class _PatchedApp:
+    """Point app's school API client at a fake _timed_get, restoring state after"""
+
+    def __init__(self, timed_get, scan_deadline=0.2):
+        import app
+        self.app = app
+        self.timed_get = timed_get
+        self.scan_deadline = scan_deadline
+
+    def __enter__(self):
+        app = self.app
+        self.saved = (app.school_api._timed_get, app.api_cfg["scan_deadline"])
+        app.school_api._timed_get = self.timed_get
+        app.api_cfg["scan_deadline"] = self.scan_deadline
+        return app
+
+    def __exit__(self, *exc):
+        app = self.app
+        app.school_api._timed_get, app.api_cfg["scan_deadline"] = self.saved
+        breaker = app.school_api_breaker
+        with breaker._lock:
+            breaker.state = "closed"
+            breaker.failures = 0
+
+
+def test_expired_deadline_gets_one_bounded_retry():
+    """A scan that waited out its deadline in the queue is looked up, not denied"""
+    calls = []
+
+    def timed_get(path, timeout, headers=None):
+        calls.append(timeout)
+        return FakeResponse(200, {"paid": True, "details": "Lunch payment confirmed"})
+
+    with _PatchedApp(timed_get) as app:
+        app.school_api_breaker.record_failure()
+        result = app.check_payment("deadline-test-1", deadline=time.monotonic() - 1)
+        assert result["paid"] is True
+        assert len(calls) == 1
+        # Bounded by a fresh scan deadline, not the full request timeout
+        assert 0 < calls[0] <= 0.2
+        assert app.school_api_breaker.failures == 0
+
+
+def test_hung_school_api_opens_the_breaker():
+    calls = []
+
+    def hang(path, timeout, headers=None):
+        calls.append(path)
+        time.sleep(0.5)
+        return FakeResponse(200, {"paid": True})
+
+    with _PatchedApp(hang) as app:
+        threshold = app.school_api_breaker.failure_threshold
+        for i in range(threshold):
+            started = time.monotonic()
+            result = app.check_payment(f"hung-test-{i}", deadline=time.monotonic() + 0.2)
+            assert result["error"] == "timeout"
+            assert time.monotonic() - started < 0.5
+        assert app.school_api_breaker.state == "open"
+        sent = len(calls)
+        assert app.check_payment("hung-test-x", deadline=time.monotonic() + 0.2)["error"] == "circuit_open"
+        assert len(calls) == sent
+        assert sent <= 2 * threshold
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
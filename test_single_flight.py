@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for coalescing concurrent lookups
+"""
+
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, callers=5):
+    """Start `callers` threads on flight.do(key, fn); return (threads, results)."""
+    results = []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def lookup():
+        calls.append(1)
+        release.wait(5)
+        return {"paid": True}
+
+    threads, results = _run_concurrently(flight, "100", lookup)
+    while flight.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{"paid": True}] * 5
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 4}
+
+
+def test_exception_is_shared_and_not_cached():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ConnectionError("school API down")
+
+    threads, results = _run_concurrently(flight, "100", failing, callers=3)
+    while flight.stats()["coalesced"] < 2:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert all(isinstance(r, ConnectionError) for r in results)
+    # The next call runs again instead of replaying the failure
+    assert flight.do("100", lambda: "ok") == "ok"
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do("1", lambda: 1) == 1
+    assert flight.do("2", lambda: 2) == 2
+    assert flight.stats()["calls"] == 2
+    assert flight.stats()["coalesced"] == 0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
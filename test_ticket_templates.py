@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the precompiled ESC/POS ticket templates
+"""
+
+from ticket_templates import (ALIGN, ERROR_TICKET, ESC_INIT, FEED_AND_CUT, MEAL_TICKET,
+                              TicketTemplate, size_command)
+
+
+def test_render_fills_fields_between_static_bytes():
+    template = TicketTemplate([
+        ("set", {"align": "center", "width": 2, "height": 2}),
+        ("text", "Hello {name}!\n"),
+        ("raw", "photo"),
+        ("cut",),
+    ])
+    assert template.fields == {"name", "photo"}
+    out = template.render(name="Amani", photo=b"<raster>")
+    assert out == (ESC_INIT + ALIGN["center"] + size_command(2, 2)
+                   + b"Hello Amani!\n" + b"<raster>" + FEED_AND_CUT)
+
+
+def test_static_steps_are_merged_at_compile_time():
+    template = TicketTemplate([
+        ("set", {"align": "left"}),
+        ("text", "A\n"),
+        ("text", "B {x}\n"),
+        ("text", "C\n"),
+        ("cut",),
+    ])
+    # init+align+size+"A\nB ", field, "\nC\n"+cut
+    assert len(template._parts) == 3
+
+
+def test_missing_fields_render_empty():
+    template = TicketTemplate([("text", "[{name}]"), ("raw", "photo")])
+    assert template.render() == ESC_INIT + b"[]"
+
+
+def test_text_is_encoded_for_the_printer():
+    template = TicketTemplate([("text", "{name}")])
+    assert template.render(name="Zoë") == ESC_INIT + "Zoë".encode("cp437")
+    # Characters the code page lacks do not break the ticket
+    assert template.render(name="✔") == ESC_INIT + b"?"
+
+
+def test_size_command():
+    assert size_command() == b"\x1d!\x00"
+    assert size_command(2, 2) == b"\x1d!\x11"
+    assert size_command(8, 1) == b"\x1d!\x70"
+
+
+def test_unknown_step_is_rejected():
+    try:
+        TicketTemplate([("bold", True)])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown step accepted")
+
+
+def test_shipped_tickets_compile():
+    meal = TicketTemplate(MEAL_TICKET)
+    assert meal.fields == {"photo", "student_name", "student_id", "details", "date"}
+    ticket = meal.render(student_name="Amani", student_id="1001", details="Lunch",
+                         date="2026-10-19", photo=None)
+    assert b"Student ID:   1001\n" in ticket
+    assert ticket.endswith(FEED_AND_CUT)
+    assert TicketTemplate(ERROR_TICKET).fields == {"photo", "message"}
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"✓ {name}")
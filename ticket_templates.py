@@ -0,0 +1,126 @@
+import string
+
+# ESC/POS commands used by the ticket layouts
+ESC_INIT = b"\x1b@"
+ALIGN = {"left": b"\x1ba\x00", "center": b"\x1ba\x01", "right": b"\x1ba\x02"}
+FEED_AND_CUT = b"\x1bd\x06\x1dV\x00"
+
+
+def size_command(width=1, height=1):
+    """GS ! n: character width / height multiplier (1-8)."""
+    return b"\x1d!" + bytes([((width - 1) << 4) | (height - 1)])
+
+
+class TicketTemplate:
+    """
+    Ticket layout compiled to ESC/POS bytes.
+
+    A layout is a list of steps:
+      ("set", {"align": ..., "width": ..., "height": ...})
+      ("text", "Student ID: {student_id}\\n")   str.format-style fields
+      ("raw", "photo")                           bytes field written as is
+      ("cut",)
+    Everything static is encoded once at compile time and adjacent static
+    steps are merged, so render() only encodes the field values and joins
+    the pieces into one buffer for a single write.
+    """
+
+    def __init__(self, layout, encoding="cp437"):
+        self.encoding = encoding
+        # bytes for static chunks, ("text", name) / ("raw", name) for fields
+        self._parts = []
+        self.fields = set()
+        self._append(ESC_INIT)
+        for step in layout:
+            kind = step[0]
+            if kind == "set":
+                options = step[1]
+                self._append(ALIGN[options.get("align", "left")])
+                self._append(size_command(options.get("width", 1), options.get("height", 1)))
+            elif kind == "text":
+                for literal, field, spec, conversion in string.Formatter().parse(step[1]):
+                    if literal:
+                        self._append(self._encode(literal))
+                    if field is not None:
+                        self._parts.append(("text", field))
+                        self.fields.add(field)
+            elif kind == "raw":
+                self._parts.append(("raw", step[1]))
+                self.fields.add(step[1])
+            elif kind == "cut":
+                self._append(FEED_AND_CUT)
+            else:
+                raise ValueError(f"Unknown template step {kind!r}")
+
+    def _encode(self, text):
+        return text.encode(self.encoding, errors="replace")
+
+    def _append(self, data):
+        if self._parts and isinstance(self._parts[-1], bytes):
+            self._parts[-1] += data
+        else:
+            self._parts.append(data)
+
+    def render(self, **values):
+        """The complete ticket as one bytes buffer."""
+        out = []
+        for part in self._parts:
+            if isinstance(part, bytes):
+                out.append(part)
+            elif part[0] == "text":
+                out.append(self._encode(str(values.get(part[1], ""))))
+            else:
+                out.append(values.get(part[1]) or b"")
+        return b"".join(out)
+
+
+HEADER = [
+    ("set", {"align": "center", "width": 2, "height": 2}),
+    ("text", "KENYA SCHOOL MEAL PROGRAM\n"),
+    ("set", {"align": "center"}),
+    ("text", "Ministry of Education\n"),
+    ("text", "------------------------------\n"),
+]
+
+MEAL_TICKET = HEADER + [
+    ("set", {"align": "center"}),
+    ("text", "SCHOOL MEAL CARD\n"),
+    ("text", "==============================\n\n"),
+    # Centred photo raster followed by a newline, or nothing
+    ("raw", "photo"),
+    ("set", {"align": "left"}),
+    ("text", "Student Name: {student_name}\n"),
+    ("text", "Student ID:   {student_id}\n"),
+    ("text", "Meal Type:    {details}\n"),
+    ("text", "Date:         {date}\n\n"),
+    ("set", {"align": "center"}),
+    ("text", "STATUS: AUTHORIZED\n"),
+    ("text", "✔ MEAL APPROVED\n\n"),
+    ("set", {"align": "center"}),
+    ("text", '\n"Education is the most powerful weapon\n'
+             'which you can use to change the world."\n'
+             "- Nelson Mandela\n"),
+    ("text", "\n==============================\n"),
+    ("text", "Enjoy your nutritious meal!\n"),
+    ("text", "Harambee! (Pull together)\n"),
+    ("cut",),
+]
+
+ERROR_TICKET = HEADER + [
+    ("set", {"align": "center"}),
+    ("text", "MEAL CARD - ACCESS DENIED\n"),
+    ("text", "==============================\n\n"),
+    ("raw", "photo"),
+    ("set", {"align": "center"}),
+    ("text", "❌ ACCESS DENIED\n"),
+    ("text", "{message}\n\n"),
+    ("text", "Please contact the school\n"),
+    ("text", "administration office to\n"),
+    ("text", "resolve this issue.\n\n"),
+    ("set", {"align": "center"}),
+    ("text", '\n"The future belongs to those\nwho believe in the beauty\n'
+             'of their dreams."\n- Eleanor Roosevelt\n'),
+    ("text", "\n==============================\n"),
+    ("text", "Harambee! (Pull together)\n"),
+    ("cut",),
+]
@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class UserDirectory:
+    """
+    In-memory user_id -> name index built from ZKDevice.get_users().
+
+    Lookups are a dict access with no device round trip. A background
+    thread refreshes the index: every `refresh_interval` seconds it reads
+    the (cheap) enrolled-user count of each device and only downloads the
+    user table when that count changed, with an unconditional reload every
+    `full_refresh_interval` to pick up renames. A lookup miss wakes the
+    thread early (at most once per `miss_refresh_interval`) so a newly
+    enrolled student gets their name on the next scan. Devices that are
+    live streaming are only refreshed every `full_refresh_interval`.
+    """
+
+    def __init__(self, refresh_interval=60, full_refresh_interval=3600,
+                 miss_refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self._names = {}
+        self._device_state = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._last_refresh = 0.0
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_id):
+        """Return the enrolled name for a user id, or None."""
+        name = self._names.get(str(user_id))
+        if name:
+            self.hits += 1
+            return name
+        self.misses += 1
+        if time.monotonic() - self._last_refresh >= self.miss_refresh_interval:
+            self._wake.set()
+        return None
+
+    def refresh(self, key, device, force=False):
+        """
+        Reload users from one device if its user count changed (or when
+        forced / the full refresh interval has passed). Returns True if the
+        user table was downloaded.
+        """
+        now = time.monotonic()
+        state = self._device_state.get(key, {"count": None, "loaded_at": 0.0})
+        if (not force and getattr(device, "streaming", False)
+                and now - state["loaded_at"] < self.full_refresh_interval):
+            # Reading the count would pause a live capture stream (and pyzk
+            # reloads the user table when it restarts); wait for the full refresh
+            return False
+        count = device.get_user_count()
+        if (not force and count is not None and count == state["count"]
+                and now - state["loaded_at"] < self.full_refresh_interval):
+            return False
+        users = device.get_users()
+        if not users and count:
+            # Transfer failed; keep what we have and try again next round
+            return False
+        names = {}
+        for u in users:
+            user_id = str(getattr(u, 'user_id', '') or '')
+            name = getattr(u, 'name', '') or ''
+            if user_id and name:
+                names[user_id] = name
+        with self._lock:
+            merged = dict(self._names)
+            merged.update(names)
+            # Swap in a new dict so lookups never see a partial update
+            self._names = merged
+        self._device_state[key] = {"count": count, "loaded_at": now}
+        logger.info("User directory loaded %d user(s) from %s", len(names), key)
+        return True
+
+    def refresh_all(self, devices, force=False):
+        for key, device in devices:
+            try:
+                self.refresh(key, device, force=force)
+            except Exception as e:
+                logger.exception("User directory refresh failed for %s: %s", key, e)
+        self._last_refresh = time.monotonic()
+
+    def start(self, devices):
+        """
+        Start background refreshes for a list of (key, ZKDevice) pairs.
+        """
+        if self._thread is not None:
+            return
+
+        def run():
+            self.refresh_all(devices, force=True)
+            while not self._stop.is_set():
+                self._wake.wait(self.refresh_interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                self.refresh_all(devices)
+
+        self._thread = threading.Thread(target=run, name="user-directory", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self):
+        return {"users": len(self._names), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._names)
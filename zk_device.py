@@ -14,12 +14,60 @@ except ImportError:
             const = None
             logging.warning("pyzk library not available, using mock implementation")
 
+import functools
+import json
+import os
+import random
+import threading
 import time
 
+from checkpoint import is_after, log_timestamp, log_user_id
+
 logger = logging.getLogger(__name__)
 
+
+def _locked(method):
+    """
+    Serialize device operations: a pyzk connection is not thread safe.
+    A live capture stream holds the lock while it runs, so a caller from
+    another thread registers as a waiter; the stream then ends at its next
+    event or timeout and does not restart until the waiters are done.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        waiting = self._stream_thread != threading.get_ident()
+        if waiting:
+            with self._idle:
+                self._waiters += 1
+        try:
+            with self._lock:
+                return method(self, *args, **kwargs)
+        finally:
+            if waiting:
+                with self._idle:
+                    self._waiters -= 1
+                    self._idle.notify_all()
+    return wrapper
+
+
 class ZKDevice:
-    def __init__(self, ip, port=4370, timeout=10):
+    """
+    Wrapper around a pyzk connection.
+
+    The connection is managed: a healthy socket is reused, liveness is
+    checked with a cheap get_time() probe when it has been idle for
+    `keepalive_interval` seconds, failed operations only drop the socket if
+    the probe also fails, and reconnects are spaced with jittered
+    exponential backoff. `state` is one of "disconnected", "connected" or
+    "backoff".
+
+    Live capture shares the socket with every other command, so while a
+    stream runs (`streaming`) other operations wait for it to pause, and
+    display messages are skipped.
+    """
+
+    def __init__(self, ip, port=4370, timeout=10, keepalive_interval=30,
+                 backoff_base=1, backoff_max=60, transfer_spacing=4):
         self.ip = ip
         self.port = port
         self.timeout = timeout
@@ -30,6 +78,29 @@ class ZKDevice:
             self.zk = None
         self.conn = None
         self._connected = False
+        # Record count seen by the last full pull_attendance() transfer
+        self.last_record_count = None
+        # Full log transfers start at least transfer_spacing x the last
+        # transfer's duration apart; polls in between only read the count
+        self.transfer_spacing = transfer_spacing
+        self.last_transfer_at = None
+        self.last_transfer_seconds = 0.0
+        self.deferred_transfers = 0
+        self.keepalive_interval = keepalive_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.state = "disconnected"
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_activity = 0.0
+        self.last_error = None
+        self.reconnects = 0
+        self._lock = threading.RLock()
+        # Live capture: threads waiting for the device, and the stream owner
+        self._idle = threading.Condition()
+        self._waiters = 0
+        self._stream_thread = None
+        self.streaming = False
 
     def connect(self):
         # Return False if pyzk is not available
@@ -37,34 +108,122 @@ class ZKDevice:
             logger.warning("pyzk library not available, cannot connect to device")
             return False
             
-        try:
-            self.conn = self.zk.connect()
-            if self.conn:
-                self.conn.disable_device()
-                self._connected = True
-                logger.info("Connected to ZK device %s:%s", self.ip, self.port)
-                return True
-            else:
-                self._connected = False
-                logger.error("Failed to establish connection to ZK device")
+        with self._lock:
+            if time.monotonic() < self.next_attempt:
+                # Still backing off after a failed attempt
                 return False
+            try:
+                self.conn = self.zk.connect()
+                if self.conn:
+                    self.conn.disable_device()
+                    self._connected = True
+                    self.state = "connected"
+                    if self.failures:
+                        self.reconnects += 1
+                    self.failures = 0
+                    self.last_error = None
+                    self._touch()
+                    logger.info("Connected to ZK device %s:%s", self.ip, self.port)
+                    return True
+                else:
+                    self._connect_failed("no connection returned")
+                    logger.error("Failed to establish connection to ZK device")
+                    return False
+            except Exception as e:
+                self._connect_failed(str(e))
+                logger.exception("Failed to connect to ZK device: %s", e)
+                return False
+
+    def _connect_failed(self, error):
+        self._connected = False
+        self.conn = None
+        self.failures += 1
+        self.last_error = error
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (self.failures - 1)))
+        delay *= random.uniform(0.5, 1.0)
+        self.next_attempt = time.monotonic() + delay
+        self.state = "backoff"
+
+    def _touch(self):
+        self.last_activity = time.monotonic()
+
+    def is_alive(self):
+        """Cheap liveness probe on the current socket."""
+        if not self._connected or self.conn is None:
+            return False
+        try:
+            if hasattr(self.conn, 'get_time'):
+                self.conn.get_time()
+            self._touch()
+            return True
         except Exception as e:
-            self._connected = False
-            logger.exception("Failed to connect to ZK device: %s", e)
+            logger.debug("Liveness probe failed on %s: %s", self.ip, e)
             return False
 
-    def disconnect(self):
+    def ensure_connected(self):
+        """
+        Reuse the current connection if it is healthy, otherwise reconnect
+        (subject to backoff). Returns True when a usable connection exists.
+        """
+        with self._lock:
+            if self._connected:
+                if time.monotonic() - self.last_activity < self.keepalive_interval:
+                    return True
+                if self.is_alive():
+                    return True
+                logger.warning("ZK device %s:%s stopped responding, reconnecting", self.ip, self.port)
+                self._drop()
+            return self.connect()
+
+    def handle_error(self, error):
+        """
+        Called after a failed operation: keep the socket if it still answers
+        a probe (transient blip), drop it otherwise.
+        """
+        with self._lock:
+            self.last_error = str(error)
+            if self.is_alive():
+                return
+            self._drop()
+
+    def _drop(self):
         try:
-            if self.conn and hasattr(self.conn, 'enable_device'):
-                self.conn.enable_device()
             if self.conn and hasattr(self.conn, 'disconnect'):
                 self.conn.disconnect()
-        except Exception as e:
-            logger.exception("Error disconnecting from ZK device: %s", e)
-        finally:
-            self.conn = None
-            self._connected = False
+        except Exception:
+            pass
+        self.conn = None
+        self._connected = False
+        self.state = "disconnected"
+
+    def connection_state(self):
+        """Connection details for status reporting"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "retry_in": max(0.0, round(self.next_attempt - time.monotonic(), 1))
+            if self.state == "backoff" else 0.0,
+            "last_transfer_seconds": round(self.last_transfer_seconds, 3),
+            "deferred_transfers": self.deferred_transfers,
+        }
+
+    def disconnect(self):
+        with self._lock:
+            try:
+                if self.conn and hasattr(self.conn, 'enable_device'):
+                    self.conn.enable_device()
+                if self.conn and hasattr(self.conn, 'disconnect'):
+                    self.conn.disconnect()
+            except Exception as e:
+                logger.exception("Error disconnecting from ZK device: %s", e)
+            finally:
+                self.conn = None
+                self._connected = False
+                self.state = "disconnected"
 
+    @_locked
     def get_users(self):
         """
         Returns list of user objects (uid, name, user_id)
@@ -74,74 +233,226 @@ class ZKDevice:
             logger.warning("pyzk library not available, returning empty user list")
             return []
             
-        if not self._connected:
-            if not self.connect():
-                return []
+        if not self.ensure_connected():
+            return []
         try:
             if self.conn and hasattr(self.conn, 'get_users'):
-                return self.conn.get_users()
+                users = self.conn.get_users()
+                self._touch()
+                return users
             else:
                 return []
         except Exception as e:
             logger.exception("get_users failed: %s", e)
-            # Try to reconnect
-            self._connected = False
+            self.handle_error(e)
             return []
 
-    def pull_attendance(self):
+    @_locked
+    def get_record_count(self):
+        """
+        Return the number of attendance records stored on the device, or None
+        if it cannot be read. This is a cheap call (no log transfer).
+        """
+        if self.zk is None:
+            return None
+        if not self.ensure_connected():
+            return None
+        try:
+            if self.conn and hasattr(self.conn, 'read_sizes'):
+                self.conn.read_sizes()
+                self._touch()
+                return getattr(self.conn, 'records', None)
+            return None
+        except Exception as e:
+            logger.exception("read_sizes failed: %s", e)
+            self.handle_error(e)
+            return None
+
+    @_locked
+    def get_user_count(self):
+        """
+        Return the number of users enrolled on the device, or None if it
+        cannot be read. Cheap: no user table transfer.
+        """
+        if self.zk is None:
+            return None
+        if not self.ensure_connected():
+            return None
+        try:
+            if self.conn and hasattr(self.conn, 'read_sizes'):
+                self.conn.read_sizes()
+                self._touch()
+                return getattr(self.conn, 'users', None)
+            return None
+        except Exception as e:
+            logger.exception("read_sizes failed: %s", e)
+            self.handle_error(e)
+            return None
+
+    @_locked
+    def pull_attendance(self, since=None, spaced=True):
         """
         Pull attendance logs from the device. Many devices have get_attendance() / get_logs().
+
+        If `since` (an AttendanceCheckpoint entry) is given, only records newer
+        than the checkpoint are returned, and the log download is skipped
+        entirely when the device record count has not changed. Downloads are
+        also postponed (returning []) until `transfer_spacing` times the last
+        download's duration has passed (unless `spaced` is False), so fast
+        polling during a rush costs a cheap count read per poll rather than a
+        full log transfer.
         """
         # Return empty list if pyzk is not available
         if self.zk is None:
             logger.warning("pyzk library not available, returning empty attendance list")
             return []
             
-        if not self._connected:
-            if not self.connect():
-                return []
+        if not self.ensure_connected():
+            return []
         try:
+            if since and since.get("records") is not None:
+                count = self.get_record_count()
+                if count is not None and count == since["records"]:
+                    self.last_record_count = count
+                    return []
+                if spaced and self.last_transfer_at is not None \
+                        and time.monotonic() - self.last_transfer_at \
+                        < self.transfer_spacing * self.last_transfer_seconds:
+                    # New records wait for the next transfer slot
+                    self.deferred_transfers += 1
+                    return []
             if self.conn and hasattr(self.conn, 'get_attendance'):
+                started = time.monotonic()
                 logs = self.conn.get_attendance()
+                self._touch()
+                self.last_transfer_at = started
+                self.last_transfer_seconds = time.monotonic() - started
                 # logs are typically tuples or objects: (uid, timestamp, status, punch)
+                self.last_record_count = len(logs)
+                if since:
+                    logs = [l for l in logs if is_after(since, l)]
                 return logs
             else:
                 return []
         except Exception as e:
             logger.exception("pull_attendance failed: %s", e)
-            # Try to reconnect
-            self._connected = False
+            self.handle_error(e)
             return []
 
+    @_locked
+    def rotate_attendance(self, is_committed, archive_path=None):
+        """
+        Clear the device attendance log once every record on it has been
+        committed by the middleware.
+
+        `is_committed(log)` must return True for records that are durably
+        recorded locally. If any record is not, nothing is deleted. Records are
+        appended to `archive_path` (JSON lines, fsynced) before clearing.
+        The device is disabled while connected, so no scan can land between
+        the read and the clear; the record count is re-checked to be sure.
+        Returns the number of records cleared.
+        """
+        if self.zk is None:
+            return 0
+        if not self.ensure_connected():
+            return 0
+        try:
+            if not (self.conn and hasattr(self.conn, 'get_attendance')
+                    and hasattr(self.conn, 'clear_attendance')):
+                return 0
+            logs = self.conn.get_attendance()
+            if not logs:
+                return 0
+            pending = [l for l in logs if not is_committed(l)]
+            if pending:
+                logger.info("Skipping log rotation on %s: %d record(s) not yet committed",
+                            self.ip, len(pending))
+                return 0
+            if archive_path:
+                self._archive(logs, archive_path)
+            count = self.get_record_count()
+            if count is not None and count != len(logs):
+                logger.warning("Device %s log changed during rotation, not clearing", self.ip)
+                return 0
+            self.conn.clear_attendance()
+            self.last_record_count = 0
+            logger.info("Cleared %d committed attendance record(s) from %s", len(logs), self.ip)
+            return len(logs)
+        except Exception as e:
+            logger.exception("rotate_attendance failed: %s", e)
+            self.handle_error(e)
+            return 0
+
+    def _archive(self, logs, archive_path):
+        directory = os.path.dirname(archive_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(archive_path, "a") as f:
+            for l in logs:
+                f.write(json.dumps({
+                    "user_id": log_user_id(l),
+                    "timestamp": str(log_timestamp(l)),
+                    "status": getattr(l, 'status', None),
+                    "punch": getattr(l, 'punch', None),
+                }) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
     def live_capture(self, timeout=10):
         """
         For devices supporting live capture, try live_capture (pyzk exposes it)
         Note: behavior depends on device model and pyzk compatibility.
+
+        Returns a generator of attendance events (None on each `timeout`
+        without one) that holds the device for as long as it runs. It ends
+        early, after the current event or timeout, when another thread needs
+        the device; the caller should catch up with a poll and start a new
+        stream.
         """
         # Return None if pyzk is not available
         if self.zk is None:
             logger.warning("pyzk library not available, live capture not supported")
             return None
             
-        if not self._connected:
-            if not self.connect():
-                return None
-        try:
-            if self.conn and hasattr(self.conn, 'live_capture'):
-                return self.conn.live_capture(timeout)
-            else:
-                return None
-        except Exception as e:
-            logger.exception("live_capture failed: %s", e)
-            # Try to reconnect
-            self._connected = False
+        if not self.ensure_connected():
+            return None
+        if not (self.conn and hasattr(self.conn, 'live_capture')):
             return None
+        return self._stream(timeout)
+
+    def _stream(self, timeout):
+        with self._idle:
+            while self._waiters:
+                self._idle.wait()
+        with self._lock:
+            conn = self.conn
+            if conn is None:
+                return
+            self._stream_thread = threading.get_ident()
+            self.streaming = True
+            try:
+                for event in conn.live_capture(timeout):
+                    self._touch()
+                    if self._waiters:
+                        # Let pyzk leave the capture loop cleanly
+                        conn.end_live_capture = True
+                    yield event
+            finally:
+                self.streaming = False
+                self._stream_thread = None
 
     def send_display_message(self, message, timeout=5):
         """
         Not all devices support display message via pyzk. This is illustrative.
         If pyzk lacks command, use vendor SDK.
         """
+        if self.streaming:
+            # Best effort: don't pause a live capture stream for a message
+            return False
+        return self._send_display_message(message)
+
+    @_locked
+    def _send_display_message(self, message):
         # Return False if pyzk is not available
         if self.zk is None:
             logger.warning("pyzk library not available, cannot send display message")